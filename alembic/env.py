@@ -2,7 +2,7 @@ from logging.config import fileConfig
 from sqlalchemy import engine_from_config, pool
 from alembic import context
 from app.core.database import Base
-from app.models import user, product, cart
+from app.models import user, product, cart, order
 import os
 from dotenv import load_dotenv
 
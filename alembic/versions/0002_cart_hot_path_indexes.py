@@ -0,0 +1,55 @@
+"""cart hot path indexes and constraints
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Merge duplicate lines left by the old read-modify-write add_to_cart
+    op.execute("""
+        WITH merged AS (
+            SELECT user_id, product_id, min(id) AS keep_id, sum(quantity) AS quantity
+            FROM carts
+            GROUP BY user_id, product_id
+            HAVING count(*) > 1
+        ), updated AS (
+            UPDATE carts SET quantity = merged.quantity
+            FROM merged
+            WHERE carts.id = merged.keep_id
+        )
+        DELETE FROM carts
+        USING merged
+        WHERE carts.user_id = merged.user_id
+          AND carts.product_id = merged.product_id
+          AND carts.id <> merged.keep_id
+    """)
+
+    # (user_id, product_id): upsert target, and serves every user_id lookup
+    op.create_unique_constraint('uq_carts_user_product', 'carts', ['user_id', 'product_id'])
+    # FK index for carts.product_id (product deletes/updates, per-product fanout)
+    op.create_index('ix_carts_product_id', 'carts', ['product_id'])
+    # Active catalog scans ordered by id
+    op.create_index(
+        'ix_products_active_id', 'products', ['id'],
+        postgresql_where=sa.text('is_active = true'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_active_id', table_name='products')
+    op.drop_index('ix_carts_product_id', table_name='carts')
+    op.drop_constraint('uq_carts_user_product', 'carts', type_='unique')
@@ -0,0 +1,35 @@
+"""product listing sort indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SORT_INDEXES = {
+    'ix_products_active_price_id': ['price', 'id'],
+    'ix_products_active_created_at_id': ['created_at', 'id'],
+    'ix_products_active_name_id': ['name', 'id'],
+}
+
+
+def upgrade() -> None:
+    # Keyset pagination over active products for each GET /products sort key
+    for name, columns in SORT_INDEXES.items():
+        op.create_index(name, 'products', columns, postgresql_where=sa.text('is_active = true'))
+
+
+def downgrade() -> None:
+    for name in SORT_INDEXES:
+        op.drop_index(name, table_name='products')
@@ -0,0 +1,31 @@
+"""product stock
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing products were sellable without limit before stock existed, so they
+    # start at the integer maximum until real quantities are set; new rows default to 0
+    op.add_column('products', sa.Column('stock', sa.Integer(), server_default='2147483647', nullable=False))
+    op.alter_column('products', 'stock', server_default='0')
+    op.create_check_constraint('ck_products_stock_non_negative', 'products', 'stock >= 0')
+
+
+def downgrade() -> None:
+    op.drop_constraint('ck_products_stock_non_negative', 'products', type_='check')
+    op.drop_column('products', 'stock')
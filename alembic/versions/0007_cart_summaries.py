@@ -0,0 +1,45 @@
+"""cart summaries
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'cart_summaries',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('item_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('total', sa.Numeric(12, 2), server_default='0', nullable=False),
+        sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    # Backfill from existing carts; lines of inactive products are not counted
+    op.execute("""
+        INSERT INTO cart_summaries (user_id, item_count, total, version)
+        SELECT carts.user_id,
+               coalesce(sum(carts.quantity) FILTER (WHERE products.is_active), 0),
+               coalesce(sum(products.price * carts.quantity) FILTER (WHERE products.is_active), 0),
+               1
+        FROM carts
+        JOIN products ON products.id = carts.product_id
+        GROUP BY carts.user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('cart_summaries')
@@ -0,0 +1,30 @@
+"""carts product -> user reverse index
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # (product_id, user_id) answers "which users hold this product" from the index alone
+    # and still serves every product_id lookup, so it replaces ix_carts_product_id
+    op.create_index('ix_carts_product_user', 'carts', ['product_id', 'user_id'])
+    op.drop_index('ix_carts_product_id', table_name='carts')
+
+
+def downgrade() -> None:
+    op.create_index('ix_carts_product_id', 'carts', ['product_id'])
+    op.drop_index('ix_carts_product_user', table_name='carts')
@@ -0,0 +1,33 @@
+"""cart fanout pending products
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 19:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # No FK to products: archived products can still have a fanout to finish
+    op.create_table(
+        'cart_fanout_pending',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('generation', sa.BigInteger(), server_default='1', nullable=False),
+        sa.Column('queued_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('product_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('cart_fanout_pending')
@@ -0,0 +1,42 @@
+"""products archive and soft delete
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'products_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('price', sa.Numeric(10, 2), nullable=False),
+        sa.Column('stock', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # Soft-deleted products awaiting archival; live listings only use the is_active = true indexes
+    op.create_index(
+        'ix_products_inactive_id', 'products', ['id'],
+        postgresql_where=sa.text('is_active = false'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_inactive_id', table_name='products')
+    op.drop_table('products_archive')
@@ -2,9 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
-from app.crud.user import get_user_by_login, create_user
-from app.core.security import verify_password, create_access_token
-from app.schemas.user import UserCreate, UserLogin, Token
+from app.crud.user import get_user_by_login, create_user, update_user_status
+from app.core.dependencies import get_current_admin_user
+from app.core.security import Principal, verify_password_async, create_access_token
+from app.schemas.user import User, UserCreate, UserLogin, UserStatusUpdate, Token
 from datetime import timedelta
 from app.core.config import settings
 
@@ -14,6 +15,19 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 router = APIRouter()
 
 
+def _access_token_for(db_user) -> str:
+    # uid/is_active/is_admin let get_current_user skip the DB when TRUST_TOKEN_CLAIMS is on
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return create_access_token(
+        data={
+            "sub": db_user.email,
+            "uid": db_user.id,
+            "is_active": db_user.is_active,
+            "is_admin": db_user.is_admin,
+        },
+        expires_delta=access_token_expires,
+    )
+
 
 @router.post("/register", response_model=Token)
 async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
@@ -29,10 +43,7 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     db_user = await create_user(db, user)
 
     # Create access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": db_user.email}, expires_delta=access_token_expires
-    )
+    access_token = _access_token_for(db_user)
 
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -40,16 +51,27 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
 @router.post("/login", response_model=Token)
 async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
     db_user = await get_user_by_login(db, user.login)
-    if not db_user or not verify_password(user.password, db_user.hashed_password):
+    if not db_user or not await verify_password_async(user.password, db_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email/phone or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": db_user.email}, expires_delta=access_token_expires
-    )
+    access_token = _access_token_for(db_user)
+
+    return {"access_token": access_token, "token_type": "bearer"}
+
 
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+@router.patch("/users/{user_id}/status", response_model=User)
+async def update_user_status_endpoint(
+    user_id: int,
+    status_update: UserStatusUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Activate/deactivate or promote/demote a user; takes effect in every worker on their next request"""
+    db_user = await update_user_status(db, user_id, is_active=status_update.is_active, is_admin=status_update.is_admin)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
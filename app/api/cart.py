@@ -1,29 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from app.core.database import get_db
-from app.crud.cart import add_to_cart, remove_from_cart, clear_cart, get_cart_items, get_cart_total
-from app.schemas.cart import CartItemCreate, CartItem, CartTotal
+from app.core.database import get_db, get_lazy_db
+from app.crud.cart import OutOfStockError, ProductUnavailableError, add_to_cart, remove_from_cart, clear_cart, get_cart_items, get_cart_summary, apply_cart_batch, get_cart_view
+from app.crud.order import EmptyCartError, checkout
+from app.schemas.order import Order
+from app.schemas.cart import CartItemCreate, CartItem, CartTotal, CartBatchRequest, CartView
 from app.core.dependencies import get_current_active_user
-from app.models.user import User
+from app.core.security import Principal
+from app.utils.pagination import etag_matches, weak_etag
 
 router = APIRouter()
 
+@router.get("", response_model=CartView)
+async def get_cart_view_endpoint(
+    db: AsyncSession = Depends(get_lazy_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    view = await get_cart_view(db, current_user.id)
+    await db.release()
+    return view
+
 @router.post("/add")
 async def add_to_cart_endpoint(
     cart_item: CartItemCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
-    cart_item = await add_to_cart(db, current_user.id, cart_item.product_id, cart_item.quantity)
+    try:
+        cart_item = await add_to_cart(db, current_user.id, cart_item.product_id, cart_item.quantity)
+    except ProductUnavailableError:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except OutOfStockError:
+        raise HTTPException(status_code=409, detail="Not enough stock")
     return {"message": "Item added to cart", "cart_item": cart_item}
 
+@router.post("/batch", response_model=List[CartItem])
+async def cart_batch_endpoint(
+    batch: CartBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    try:
+        return await apply_cart_batch(db, current_user.id, batch.operations)
+    except ProductUnavailableError:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except OutOfStockError as e:
+        raise HTTPException(
+            status_code=409, detail={"message": "Not enough stock", "product_ids": e.product_ids}
+        )
+
+@router.post("/checkout", response_model=Order)
+async def checkout_endpoint(
+    response: Response,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """Place an order from the cart; retries with the same Idempotency-Key return the same order"""
+    try:
+        order, replayed = await checkout(db, current_user.id, idempotency_key)
+    except EmptyCartError:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    except OutOfStockError as e:
+        raise HTTPException(
+            status_code=409, detail={"message": "Not enough stock", "product_ids": e.product_ids}
+        )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return order
+
 @router.delete("/remove")
 async def remove_from_cart_endpoint(
     product_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     cart_item = await remove_from_cart(db, current_user.id, product_id)
     if not cart_item:
@@ -33,23 +85,31 @@ async def remove_from_cart_endpoint(
 @router.delete("/clear")
 async def clear_cart_endpoint(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     count = await clear_cart(db, current_user.id)
     return {"message": f"Cart cleared, {count} items removed"}
 
 @router.get("/items", response_model=List[CartItem])
 async def get_cart_items_endpoint(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_lazy_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     cart_items = await get_cart_items(db, current_user.id)
+    await db.release()
     return cart_items
 
 @router.get("/total", response_model=CartTotal)
 async def get_cart_total_endpoint(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_lazy_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
-    total = await get_cart_total(db, current_user.id)
-    return {"total": total}
\ No newline at end of file
+    summary = await get_cart_summary(db, current_user.id)
+    await db.release()
+    etag = weak_etag([(summary.version, summary.item_count, summary.total)])
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return summary
\ No newline at end of file
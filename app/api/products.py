@@ -1,30 +1,177 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Literal
 
-from app.core.database import get_db
-from app.crud.product import get_products, get_product, create_product, update_product, delete_product
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db, get_lazy_db
+from app.crud.product import (
+    catalog_cache, copy_products, create_product, delete_product, get_product, get_products, search_products,
+    stream_products, update_product,
+)
 from app.schemas.product import Product, ProductCreate, ProductUpdate
 from app.core.dependencies import get_current_active_user, get_current_admin_user
-from app.models.user import User
+from app.core.security import Principal
+from app.utils.bulk_import import ImportFormatError, iter_row_batches, validate_rows
+from app.utils.export import csv_chunk, ndjson_chunk
+from app.utils.pagination import decode_cursor, encode_cursor, etag_matches, weak_etag
 
 router = APIRouter()
 
+SortKey = Literal["id", "-id", "price", "-price", "created_at", "-created_at", "name", "-name"]
+
+def _decode_position(after: str, sort: str) -> tuple:
+    """Cursor -> (sort value, id); cursors without a sort key are legacy id-only ones"""
+    cursor = decode_cursor(after)
+    if cursor.get("s", "id") != sort:
+        raise ValueError("Cursor was issued for a different sort")
+    value = cursor.get("v")
+    field = sort.lstrip("-")
+    if field == "price":
+        value = Decimal(value)
+    elif field == "created_at":
+        value = datetime.fromisoformat(value)
+    elif field == "name":
+        value = str(value)
+    return value, int(cursor["id"])
+
 @router.get("/", response_model=List[Product])
 async def read_products(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    after: str | None = None,
+    sort: SortKey = "id",
+    min_price: Decimal | None = None,
+    max_price: Decimal | None = None,
+    created_after: datetime | None = None,
+    include_inactive: bool = False,
+    db: AsyncSession = Depends(get_lazy_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    if include_inactive and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    position = None
+    if after is not None:
+        try:
+            position = _decode_position(after, sort)
+        except (ValueError, KeyError, TypeError, InvalidOperation):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    products = await get_products(
+        db, skip=skip, limit=limit, after=position, sort=sort,
+        min_price=min_price, max_price=max_price, created_after=created_after, include_inactive=include_inactive,
+    )
+    await db.release()
+
+    etag = weak_etag((p.id, p.name, p.price, p.stock, p.is_active, p.updated_at) for p in products)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    if products and len(products) == limit:
+        last = products[-1]
+        value = getattr(last, sort.lstrip("-"))
+        response.headers["X-Next-Cursor"] = encode_cursor({"s": sort, "v": value, "id": last.id})
+    return products
+
+@router.get("/search", response_model=List[Product])
+async def search_products_endpoint(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    after: str | None = None,
+    db: AsyncSession = Depends(get_lazy_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
-    products = await get_products(db, skip=skip, limit=limit)
+    """Name search ranked by trigram similarity; X-Next-Cursor continues the ranking"""
+    position = None
+    if after is not None:
+        try:
+            cursor = decode_cursor(after)
+            position = (Decimal(cursor["r"]), int(cursor["id"]))
+        except (ValueError, KeyError, TypeError, InvalidOperation):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    products, next_position = await search_products(db, q, limit=limit, after=position)
+    await db.release()
+
+    if next_position is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor({"r": str(next_position[0]), "id": next_position[1]})
     return products
 
+EXPORT_COLUMNS = ("id", "name", "price", "stock", "is_active", "created_at", "updated_at")
+
+async def _export_chunks(format: str):
+    # Dependencies with yield are torn down before the body is streamed,
+    # so the generator owns its session for the whole export
+    async with AsyncSessionLocal() as db:
+        if format == "csv":
+            yield csv_chunk([EXPORT_COLUMNS])
+        async for batch in stream_products(db, batch_size=settings.EXPORT_BATCH_SIZE):
+            if format == "csv":
+                yield csv_chunk([row[c] for c in EXPORT_COLUMNS] for row in batch)
+            else:
+                yield ndjson_chunk(batch)
+
+@router.get("/export")
+async def export_products(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Stream the whole catalog; each chunk is one cursor batch, sent only as fast as the client reads"""
+    if not AsyncSessionLocal:
+        raise HTTPException(status_code=503, detail="Database engine is not available")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_chunks(format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'},
+    )
+
+@router.post("/import")
+async def import_products(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Bulk-load products from a streamed CSV (with header) or NDJSON body, one record per line.
+
+    Valid rows are loaded with COPY in a single transaction; invalid rows are
+    skipped and reported by line number.
+    """
+    imported, failed, errors = 0, 0, []
+    try:
+        async for batch in iter_row_batches(request.stream(), format, settings.IMPORT_BATCH_SIZE):
+            products, batch_errors = validate_rows(batch)
+            imported += await copy_products(db, products)
+            failed += len(batch_errors)
+            errors.extend(batch_errors[:settings.IMPORT_MAX_REPORTED_ERRORS - len(errors)])
+    except ImportFormatError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except DBAPIError as e:
+        # A row the schema let through but the database refused; nothing is imported
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Import rejected by the database: {e.orig}")
+
+    if imported:
+        await db.commit()
+        await catalog_cache.invalidate()
+    return {"imported": imported, "failed": failed, "errors": errors}
+
 @router.post("/", response_model=Product)
 async def create_product_endpoint(
     product: ProductCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     return await create_product(db, product)
 
@@ -33,7 +180,7 @@ async def update_product_endpoint(
     product_id: int,
     product: ProductUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     db_product = await update_product(db, product_id, product)
     if not db_product:
@@ -44,7 +191,7 @@ async def update_product_endpoint(
 async def delete_product_endpoint(
     product_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     db_product = await delete_product(db, product_id)
     if not db_product:
@@ -0,0 +1,229 @@
+import asyncio
+import importlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from app.core.config import settings
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class TaggedTTLCache(TTLCache):
+    """TTLCache whose entries carry tags; invalidate_tag() drops every entry with a tag.
+
+    The tag -> keys map is a reverse index, so invalidation touches only the
+    affected entries. Tags of evicted or expired keys are pruned lazily.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        super().__init__(max_size, ttl)
+        self._keys_by_tag: dict[Hashable, set] = {}
+        self._tags_by_key: dict[Hashable, tuple] = {}
+
+    def _untag(self, key: Hashable):
+        for tag in self._tags_by_key.pop(key, ()):
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, tags=()):
+        self._untag(key)
+        super().set(key, value, ttl=ttl)
+        if key in self._data:
+            self._tags_by_key[key] = tuple(tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+        if len(self._tags_by_key) > 2 * len(self._data) + 64:
+            for stale in [k for k in self._tags_by_key if k not in self._data]:
+                self._untag(stale)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        self._untag(key)
+        return super().pop(key, default)
+
+    def invalidate_tag(self, tag: Hashable) -> int:
+        dropped = 0
+        for key in self._keys_by_tag.pop(tag, set()):
+            dropped += key in self._data
+            self.pop(key)
+        return dropped
+
+    def clear(self):
+        super().clear()
+        self._keys_by_tag.clear()
+        self._tags_by_key.clear()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "tags": len(self._keys_by_tag)}
+
+
+class CacheBackend:
+    """Shared cache backend interface, e.g. Redis behind an adapter"""
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+    async def get_counter(self, key: str) -> int:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Process-local stand-in for a shared backend (default, and for tests)"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600):
+        self._values = TTLCache(max_size, ttl)
+        self._counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> Any:
+        return self._values.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._values.set(key, value, ttl=ttl)
+
+    async def get_counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+
+def create_cache_backend(name: str) -> CacheBackend:
+    """Build a backend from its setting: 'memory' or 'package.module:ClassName'"""
+    if name == "memory":
+        return InMemoryCacheBackend()
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown cache backend: {name}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class ReadThroughCache:
+    """In-process LRU in front of a shared backend, filled by async loaders.
+
+    Keys are namespaced by a generation counter stored in the backend, so
+    invalidate() retires every entry in every worker with one increment.
+    Concurrent misses for the same key wait on a per-key lock and share
+    the first caller's load instead of all hitting the database.
+    """
+
+    def __init__(self, namespace: str, backend: CacheBackend, max_size: int, ttl: float):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self.local = TTLCache(max_size, ttl)
+        self.loads = 0
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def _lookup(self, full_key: str) -> Optional[tuple]:
+        # Values are wrapped in a 1-tuple so a cached None is distinguishable from a miss
+        entry = self.local.get(full_key)
+        if entry is None:
+            entry = await self.backend.get(full_key)
+            if entry is not None:
+                self.local.set(full_key, entry)
+        return entry
+
+    async def generation(self) -> int:
+        """Current namespace generation; bumped by every invalidate()"""
+        return await self.backend.get_counter(f"{self.namespace}:generation")
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        generation = await self.generation()
+        full_key = f"{self.namespace}:{generation}:{key}"
+
+        entry = await self._lookup(full_key)
+        if entry is not None:
+            return entry[0]
+
+        lock = self._locks.setdefault(full_key, asyncio.Lock())
+        try:
+            async with lock:
+                entry = await self._lookup(full_key)
+                if entry is not None:
+                    return entry[0]
+
+                value = await loader()
+                self.loads += 1
+                entry = (value,)
+                await self.backend.set(full_key, entry, self.ttl)
+                self.local.set(full_key, entry)
+                return value
+        finally:
+            if not lock.locked() and self._locks.get(full_key) is lock:
+                del self._locks[full_key]
+
+    async def invalidate(self):
+        await self.backend.incr(f"{self.namespace}:generation")
+        self.local.clear()
+
+    def stats(self) -> dict:
+        return {**self.local.stats(), "loads": self.loads}
+
+
+shared_cache_backend = create_cache_backend(settings.CACHE_BACKEND)
@@ -12,6 +12,27 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD",)
     POSTGRES_PORT: str = os.getenv("POSTGRES_PORT", "5432")
 
+    # Read replicas: comma-separated postgresql:// URLs, empty means primary only
+    DATABASE_REPLICA_URLS: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    # How long a failing replica is taken out of rotation
+    REPLICA_EJECT_SECONDS: int = int(os.getenv("REPLICA_EJECT_SECONDS", 30))
+    # How long a user's reads stay on the primary after they change their cart
+    READ_YOUR_WRITES_SECONDS: int = int(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+
+    # Connection pool (per worker): keep workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below max_connections
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 300))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+    DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+    # Compiled SQL cache per engine and asyncpg prepared statements kept per connection
+    DB_QUERY_CACHE_SIZE: int = int(os.getenv("DB_QUERY_CACHE_SIZE", 1000))
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", 500))
+    # Development only: create missing tables with create_all at startup. The schema is
+    # owned by the Alembic migrations; create_all cannot alter existing tables.
+    DB_CREATE_ALL_ON_STARTUP: bool = os.getenv("DB_CREATE_ALL_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
     # Application
     APP_PORT: str = os.getenv("APP_PORT", "8000")
 
@@ -19,6 +40,54 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "default-secret-key-change-in-production")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+    # Rotating signing keys: "kid1:secret1,kid2:secret2"; new tokens are signed with JWT_ACTIVE_KID.
+    # Tokens without a kid header are still verified with SECRET_KEY.
+    JWT_KEYS: str = os.getenv("JWT_KEYS", "")
+    JWT_ACTIVE_KID: str = os.getenv("JWT_ACTIVE_KID", "")
+    TOKEN_CACHE_MAX_SIZE: int = int(os.getenv("TOKEN_CACHE_MAX_SIZE", 10000))
+    TOKEN_CACHE_TTL_SECONDS: int = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300))
+
+    # Password hashing (bcrypt runs in a bounded thread pool)
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+    # Authenticated principal cache, shared through CACHE_BACKEND. Status changes made via
+    # PATCH /auth/users/{id}/status apply at once in every worker; direct database edits
+    # are picked up only after PRINCIPAL_CACHE_TTL_SECONDS
+    PRINCIPAL_CACHE_TTL_SECONDS: int = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+    PRINCIPAL_CACHE_MAX_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", 10000))
+    # Build the principal from signed token claims without touching the database; status
+    # changes then apply only once the user's current token expires
+    TRUST_TOKEN_CLAIMS: bool = os.getenv("TRUST_TOKEN_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+    # Caching: "memory" or "package.module:ClassName" of a shared CacheBackend
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")
+    CATALOG_CACHE_TTL_SECONDS: int = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", 30))
+    CATALOG_CACHE_MAX_SIZE: int = int(os.getenv("CATALOG_CACHE_MAX_SIZE", 1000))
+    # Product search pages, cached per worker (also remembers prefixes with no matches)
+    SEARCH_CACHE_TTL_SECONDS: int = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", 30))
+    SEARCH_CACHE_MAX_SIZE: int = int(os.getenv("SEARCH_CACHE_MAX_SIZE", 10000))
+
+    # Per-worker cart summary cache and the price-change fanout that refreshes summaries
+    CART_SUMMARY_CACHE_TTL_SECONDS: int = int(os.getenv("CART_SUMMARY_CACHE_TTL_SECONDS", 5))
+    CART_SUMMARY_CACHE_MAX_SIZE: int = int(os.getenv("CART_SUMMARY_CACHE_MAX_SIZE", 10000))
+    CART_FANOUT_CHUNK_SIZE: int = int(os.getenv("CART_FANOUT_CHUNK_SIZE", 500))
+    CART_FANOUT_BATCH_SECONDS: float = float(os.getenv("CART_FANOUT_BATCH_SECONDS", 0.05))
+    # Upper bound of the exponential backoff between retries of a failed fanout
+    CART_FANOUT_MAX_RETRY_SECONDS: float = float(os.getenv("CART_FANOUT_MAX_RETRY_SECONDS", 30))
+
+    # Soft-deleted products are moved to products_archive after this many days inactive
+    PRODUCT_ARCHIVE_AFTER_DAYS: int = int(os.getenv("PRODUCT_ARCHIVE_AFTER_DAYS", 30))
+    PRODUCT_ARCHIVE_BATCH_SIZE: int = int(os.getenv("PRODUCT_ARCHIVE_BATCH_SIZE", 1000))
+    PRODUCT_ARCHIVE_INTERVAL_SECONDS: int = int(os.getenv("PRODUCT_ARCHIVE_INTERVAL_SECONDS", 3600))
+    # First retry delay after a failed archival run, doubled up to the interval
+    PRODUCT_ARCHIVE_RETRY_SECONDS: float = float(os.getenv("PRODUCT_ARCHIVE_RETRY_SECONDS", 5))
+
+    # Catalog export: rows fetched per server-side cursor batch (and per streamed chunk)
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+    # Catalog import: rows validated and COPY'd per batch, and max per-row errors returned
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", 5000))
+    IMPORT_MAX_REPORTED_ERRORS: int = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", 100))
 
     # Database URL
     DATABASE_URL: str = os.getenv(
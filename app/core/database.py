@@ -1,30 +1,59 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core.metrics import LatencyHistogram, register_collector
 import logging
 import asyncio
+import time
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+pool_wait_time = LatencyHistogram(buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0))
+pool_timeouts = 0
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        global pool_timeouts
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_timeouts += 1
+            raise
+        finally:
+            pool_wait_time.observe(time.perf_counter() - started)
+
+
 # Создание асинхронного движка с расширенной обработкой ошибок
-def create_engine_with_retry():
+def create_engine_with_retry(database_url: str | None = None):
     try:
-        db_url = settings.DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://')
+        db_url = (database_url or settings.DATABASE_URL).replace('postgresql://', 'postgresql+asyncpg://')
         logger.info(f"Попытка подключения к: {db_url}")
 
         engine = create_async_engine(
             db_url,
-            echo=True,
-            pool_pre_ping=True,
-            pool_recycle=300,
+            echo=settings.DB_ECHO,
+            poolclass=InstrumentedPool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            query_cache_size=settings.DB_QUERY_CACHE_SIZE,
             connect_args={
                 "timeout": 30,
                 "command_timeout": 30,
+                "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
             }
         )
         logger.info("Database engine created successfully")
@@ -40,17 +69,157 @@ except Exception as e:
     logger.error(f"Failed to create database engine: {e}")
     engine = None
 
+
+class ReplicaRouter:
+    """Round-robin over replica engines with health-based ejection.
+
+    A replica whose connection fails is skipped for REPLICA_EJECT_SECONDS.
+    Users who just changed their cart are pinned to the primary for
+    READ_YOUR_WRITES_SECONDS so they never read their own stale cart.
+    """
+
+    def __init__(self, engines, eject_seconds: float, sticky_seconds: float):
+        self.engines = list(engines)
+        self.eject_seconds = eject_seconds
+        self.sticky_seconds = sticky_seconds
+        self._next = 0
+        self._ejected_until = {}
+        self._sticky_until = {}
+
+    def pick(self):
+        """Next healthy replica, or None to fall back to the primary"""
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            replica = self.engines[self._next % len(self.engines)]
+            self._next += 1
+            if self._ejected_until.get(id(replica), 0) <= now:
+                return replica
+        return None
+
+    def eject(self, replica):
+        logger.warning("Ejecting read replica for %s seconds", self.eject_seconds)
+        self._ejected_until[id(replica)] = time.monotonic() + self.eject_seconds
+
+    def stick_to_primary(self, user_id: int):
+        now = time.monotonic()
+        # Re-inserting keeps the dict ordered by deadline, so expired users are
+        # dropped from the front and the map stays bounded by the recent writers
+        self._sticky_until.pop(user_id, None)
+        self._sticky_until[user_id] = now + self.sticky_seconds
+        for stale in list(self._sticky_until):
+            if self._sticky_until[stale] > now:
+                break
+            del self._sticky_until[stale]
+
+    def is_sticky(self, user_id: int) -> bool:
+        deadline = self._sticky_until.get(user_id)
+        if deadline is None:
+            return False
+        if deadline <= time.monotonic():
+            del self._sticky_until[user_id]
+            return False
+        return True
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.engines),
+            "ejected": sum(1 for until in self._ejected_until.values() if until > now),
+            "sticky_users": len(self._sticky_until),
+        }
+
+
+def _create_replica_engines():
+    replicas = []
+    for url in filter(None, (u.strip() for u in settings.DATABASE_REPLICA_URLS.split(","))):
+        try:
+            replica = create_engine_with_retry(url)
+        except Exception as e:
+            logger.error(f"Failed to create replica engine: {e}")
+            continue
+
+        def on_error(context, replica=replica):
+            if context.is_disconnect or isinstance(context.original_exception, OSError):
+                replica_router.eject(replica)
+
+        event.listen(replica.sync_engine, "handle_error", on_error)
+        replicas.append(replica)
+    return replicas
+
+
+replica_router = ReplicaRouter(_create_replica_engines(), settings.REPLICA_EJECT_SECONDS, settings.READ_YOUR_WRITES_SECONDS)
+register_collector("replicas", replica_router.stats)
+
+
+class RoutingSession(Session):
+    """Routes statements executed with bind_arguments={"replica": True} to a replica"""
+
+    def get_bind(self, mapper=None, *, clause=None, replica=False, **kw):
+        if replica and not self._flushing:
+            replica_engine = replica_router.pick()
+            if replica_engine is not None:
+                return replica_engine.sync_engine
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+def replica_bind(user_id: int | None = None) -> dict:
+    """bind_arguments for a read that may go to a replica (unless the user just wrote)"""
+    if user_id is not None and replica_router.is_sticky(user_id):
+        return {}
+    return {"replica": True}
+
+
+class LazyReleaseSession(AsyncSession):
+    """Session for read-only request paths.
+
+    Like any AsyncSession it checks out a connection only on the first query,
+    so requests answered from caches never touch the pool. All reads of a
+    request run on that one connection; the endpoint calls release() once its
+    read phase is over, so the connection goes back to the pool before the
+    response is built rather than when the request's dependencies are torn
+    down. Loaded objects stay usable but are detached, so this session must
+    not be used for writes.
+    """
+
+    async def release(self):
+        """End the read phase and return the connection to the pool"""
+        await self.close()
+
+
 if engine:
     # Создание асинхронной сессии
     AsyncSessionLocal = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
+        engine, class_=AsyncSession, sync_session_class=RoutingSession, expire_on_commit=False
+    )
+    LazySessionLocal = sessionmaker(
+        engine, class_=LazyReleaseSession, sync_session_class=RoutingSession, expire_on_commit=False
     )
 else:
     AsyncSessionLocal = None
+    LazySessionLocal = None
 
 Base = declarative_base()
 
 
+def pool_stats() -> dict:
+    if not engine:
+        return {"available": False}
+    pool = engine.pool
+    return {
+        "available": True,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "timeouts": pool_timeouts,
+        "wait_seconds": pool_wait_time.snapshot(),
+    }
+
+
+register_collector("db_pool", pool_stats)
+
+
 async def get_db():
     if not AsyncSessionLocal:
         raise Exception("Database engine is not available")
@@ -65,6 +234,15 @@ async def get_db():
             await session.close()
 
 
+async def get_lazy_db():
+    """Read-only session that holds a pooled connection only until the endpoint releases it"""
+    if not LazySessionLocal:
+        raise Exception("Database engine is not available")
+
+    async with LazySessionLocal() as session:
+        yield session
+
+
 async def test_connection():
     """Тест подключения к базе данных"""
     if not engine:
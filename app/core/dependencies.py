@@ -1,11 +1,12 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from jose import JWTError, jwt
+from jose import JWTError
 from typing import Optional
 
 from app.core.database import get_db
 from app.core.config import settings
+from app.core.security import Principal, decode_access_token, principal_cache
 from app.crud.user import get_user_by_email, get_user_by_phone
 from app.models.user import User
 
@@ -13,6 +14,28 @@ from app.models.user import User
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
+def _principal_from_user(user: User) -> Principal:
+    return Principal(
+        id=user.id,
+        full_name=user.full_name,
+        email=user.email,
+        phone=user.phone,
+        is_active=user.is_active,
+        is_admin=user.is_admin,
+    )
+
+
+def _principal_from_claims(payload: dict) -> Optional[Principal]:
+    if "uid" not in payload:
+        return None
+    return Principal(
+        id=payload["uid"],
+        email=payload["sub"],
+        is_active=payload.get("is_active", True),
+        is_admin=payload.get("is_admin", False),
+    )
+
+
 async def get_current_user(
         token: str = Depends(oauth2_scheme),
         db: AsyncSession = Depends(get_db)
@@ -23,21 +46,33 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_access_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = await get_user_by_email(db, email)
-    if user is None:
-        raise credentials_exception
-    return user
+    if settings.TRUST_TOKEN_CLAIMS:
+        principal = _principal_from_claims(payload)
+        if principal is not None:
+            return principal
+
+    async def load_principal():
+        user = await get_user_by_email(db, email)
+        principal = _principal_from_user(user) if user is not None else None
+        # Write routes get this same session from get_db; end the lookup
+        # transaction so its connection is not held until their own writes
+        await db.rollback()
+        if principal is None:
+            raise credentials_exception
+        return principal
+
+    return await principal_cache.get_or_load(email, load_principal)
 
 
 async def get_current_active_user(
-        current_user: User = Depends(get_current_user)
+        current_user: Principal = Depends(get_current_user)
 ):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -45,7 +80,7 @@ async def get_current_active_user(
 
 
 async def get_current_admin_user(
-        current_user: User = Depends(get_current_active_user)
+        current_user: Principal = Depends(get_current_active_user)
 ):
     if not current_user.is_admin:
         raise HTTPException(
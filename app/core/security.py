@@ -1,8 +1,15 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from app.core.cache import ReadThroughCache, TTLCache, shared_cache_backend
 from app.core.config import settings
+from app.core.metrics import LatencyHistogram, register_collector
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -12,6 +19,105 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+
+class HashingPoolSaturated(Exception):
+    """Raised when the password hashing executor has no free queue slots"""
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL while hashing, so threads give real parallelism.
+    At most ``max_pending`` calls may be running or queued; beyond that new
+    calls are rejected with ``HashingPoolSaturated`` instead of piling up.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.pending = 0
+        self.rejected = 0
+        self.latency = LatencyHistogram()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HashingPoolSaturated("Password hashing queue is full")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            result = await loop.run_in_executor(self._executor, func, *args)
+            self.latency.observe(time.perf_counter() - started)
+            return result
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "queue_depth": max(self.pending - self.max_workers, 0),
+            "rejected": self.rejected,
+            "latency_seconds": self.latency.snapshot(),
+        }
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
+register_collector("password_hashing", password_hasher.stats)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Authenticated user as seen by endpoints: plain values, safe to share between requests"""
+    id: int
+    email: str
+    full_name: Optional[str] = None
+    phone: Optional[str] = None
+    is_active: bool = True
+    is_admin: bool = False
+
+
+# Token subject (email) -> Principal. update_user_status() bumps the generation
+# in the shared backend, which retires cached principals in every worker
+principal_cache = ReadThroughCache(
+    "principal", shared_cache_backend, settings.PRINCIPAL_CACHE_MAX_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+register_collector("principal_cache", principal_cache.stats)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
+
+def parse_signing_keys(raw: str) -> dict:
+    """Parse "kid1:secret1,kid2:secret2" into {kid: secret}"""
+    keys = {}
+    for item in raw.split(","):
+        kid, sep, secret = item.strip().partition(":")
+        if sep and kid and secret:
+            keys[kid] = secret
+    return keys
+
+
+signing_keys = parse_signing_keys(settings.JWT_KEYS)
+
+# sha256(token) -> verified payload, kept until the token's exp
+token_cache = TTLCache(settings.TOKEN_CACHE_MAX_SIZE, settings.TOKEN_CACHE_TTL_SECONDS)
+register_collector("token_cache", token_cache.stats)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -19,5 +125,34 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    kid = settings.JWT_ACTIVE_KID
+    if kid and kid in signing_keys:
+        return jwt.encode(to_encode, signing_keys[kid], algorithm=settings.ALGORITHM, headers={"kid": kid})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+
+def decode_access_token(token: str) -> dict:
+    """Verify a JWT and return its payload; raises JWTError.
+
+    Verified payloads are memoized by token hash until the token expires,
+    so a session's repeated requests pay for signature checking once.
+    """
+    cache_key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(cache_key)
+    if payload is not None:
+        return payload
+
+    kid = jwt.get_unverified_header(token).get("kid")
+    if kid is None:
+        key = settings.SECRET_KEY
+    elif kid in signing_keys:
+        key = signing_keys[kid]
+    else:
+        raise JWTError("Unknown signing key")
+
+    payload = jwt.decode(token, key, algorithms=[settings.ALGORITHM])
+    exp = payload.get("exp")
+    if exp is not None:
+        token_cache.set(cache_key, payload, ttl=exp - time.time())
+    return payload
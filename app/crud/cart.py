@@ -1,68 +1,496 @@
+import asyncio
+import logging
+import time
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func
-from app.models.cart import Cart
+from sqlalchemy import delete, func, lambda_stmt, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.core.cache import TaggedTTLCache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, replica_bind, replica_router
+from app.core.metrics import LatencyHistogram, register_collector
+from app.models.cart import Cart, CartFanoutPending, CartSummary
 from app.models.product import Product
+from app.schemas.cart import CartItemList, CartTotal
+
+logger = logging.getLogger(__name__)
+
+
+class ProductUnavailableError(Exception):
+    """The product does not exist or is not active"""
+
+
+class OutOfStockError(Exception):
+    """Not enough stock for the requested quantity"""
+
+    def __init__(self, product_ids):
+        super().__init__(f"Not enough stock for products {list(product_ids)}")
+        self.product_ids = list(product_ids)
+
+
+# cart_summaries holds item_count/total over a user's lines of active products.
+# Single-line writes adjust it by the line's delta in the same statement;
+# bulk writes recompute it with _SUMMARY_REFRESH.
+
+# The postgresql insert() construct is not cacheable by SQLAlchemy and would be
+# recompiled on every call; a textual statement is compiled once and reused.
+# The line is only written if the product is active and has stock for the
+# resulting quantity; this is a soft check, stock is reserved at checkout.
+# FOR SHARE holds off a concurrent price change until this write commits (so
+# its fanout sees the line), and if the change committed first the lock returns
+# the new row version, whose price goes into the summary delta.
+_CART_UPSERT = select(Cart).from_statement(text("""
+    WITH product AS (
+        SELECT id, price FROM products
+        WHERE id = :product_id AND is_active AND stock >= :quantity AND :quantity > 0
+        FOR SHARE
+    ), line AS (
+        INSERT INTO carts (user_id, product_id, quantity)
+        SELECT :user_id, product.id, :quantity
+        FROM product
+        ON CONFLICT (user_id, product_id)
+        DO UPDATE SET quantity = carts.quantity + excluded.quantity
+        WHERE carts.quantity + excluded.quantity <= (SELECT stock FROM products WHERE id = excluded.product_id)
+        RETURNING id, user_id, product_id, quantity, created_at
+    ), summary AS (
+        INSERT INTO cart_summaries (user_id, item_count, total, version)
+        SELECT line.user_id, :quantity, product.price * :quantity, 1
+        FROM line
+        JOIN product ON product.id = line.product_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            item_count = cart_summaries.item_count + excluded.item_count,
+            total = cart_summaries.total + excluded.total,
+            version = cart_summaries.version + 1
+    )
+    SELECT id, user_id, product_id, quantity, created_at FROM line
+""")).execution_options(populate_existing=True)
+
+_CART_REMOVE = text("""
+    WITH removed AS (
+        DELETE FROM carts
+        WHERE user_id = :user_id AND product_id = :product_id
+        RETURNING id, product_id, quantity
+    ), delta AS (
+        SELECT coalesce(sum(removed.quantity), 0) AS item_count,
+               coalesce(sum(products.price * removed.quantity), 0) AS total
+        FROM removed
+        JOIN products ON products.id = removed.product_id AND products.is_active
+    ), summary AS (
+        UPDATE cart_summaries
+        SET item_count = cart_summaries.item_count - delta.item_count,
+            total = cart_summaries.total - delta.total,
+            version = cart_summaries.version + 1
+        FROM delta
+        WHERE cart_summaries.user_id = :user_id AND EXISTS (SELECT 1 FROM removed)
+    )
+    SELECT id, product_id, quantity FROM removed
+""")
+
+_CART_CLEAR = text("""
+    WITH removed AS (
+        DELETE FROM carts WHERE user_id = :user_id RETURNING id
+    ), summary AS (
+        UPDATE cart_summaries
+        SET item_count = 0, total = 0, version = cart_summaries.version + 1
+        WHERE user_id = :user_id
+    )
+    SELECT count(*) FROM removed
+""")
+
+_SUMMARY_REFRESH = text("""
+    INSERT INTO cart_summaries (user_id, item_count, total, version)
+    SELECT :user_id, coalesce(sum(carts.quantity), 0), coalesce(sum(products.price * carts.quantity), 0), 1
+    FROM carts
+    JOIN products ON products.id = carts.product_id AND products.is_active
+    WHERE carts.user_id = :user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        item_count = excluded.item_count,
+        total = excluded.total,
+        version = cart_summaries.version + 1
+""")
+
+# Recompute the summaries of one chunk of users
+_SUMMARY_REFRESH_USERS = text("""
+    UPDATE cart_summaries
+    SET item_count = agg.item_count, total = agg.total, version = cart_summaries.version + 1
+    FROM (
+        SELECT carts.user_id,
+               coalesce(sum(carts.quantity) FILTER (WHERE products.is_active), 0) AS item_count,
+               coalesce(sum(products.price * carts.quantity) FILTER (WHERE products.is_active), 0) AS total
+        FROM carts
+        JOIN products ON products.id = carts.product_id
+        WHERE carts.user_id = ANY(:user_ids)
+        GROUP BY carts.user_id
+    ) AS agg
+    WHERE cart_summaries.user_id = agg.user_id
+""")
+
+# Next chunk of users holding any of the products, in user_id order (ix_carts_product_user)
+_AFFECTED_USERS = text("""
+    SELECT DISTINCT user_id FROM carts
+    WHERE product_id = ANY(:product_ids) AND user_id > :after_user_id
+    ORDER BY user_id
+    LIMIT :chunk_size
+""")
+
+_FANOUT_MARK_PENDING = text("""
+    INSERT INTO cart_fanout_pending (product_id) VALUES (:product_id)
+    ON CONFLICT (product_id) DO UPDATE SET
+        generation = cart_fanout_pending.generation + 1,
+        queued_at = now()
+""")
+
+# Clear the pending rows a refresh has covered, unless they were marked again meanwhile
+_FANOUT_DONE = text("""
+    DELETE FROM cart_fanout_pending
+    USING unnest(CAST(:product_ids AS integer[]), CAST(:generations AS bigint[])) AS done(product_id, generation)
+    WHERE cart_fanout_pending.product_id = done.product_id
+      AND cart_fanout_pending.generation = done.generation
+""")
+
+
+# user_id -> CartTotal, tagged with the user's product ids so a price change
+# drops exactly the summaries that include the product
+cart_summary_cache = TaggedTTLCache(settings.CART_SUMMARY_CACHE_MAX_SIZE, settings.CART_SUMMARY_CACHE_TTL_SECONDS)
+register_collector("cart_summary_cache", cart_summary_cache.stats)
+
+
+def note_cart_write(user_id: int):
+    """Bookkeeping after a committed cart write: read-your-writes and local cache"""
+    replica_router.stick_to_primary(user_id)
+    cart_summary_cache.pop(user_id)
 
 
 async def add_to_cart(db: AsyncSession, user_id: int, product_id: int, quantity: int = 1):
-    # Check if item already in cart
+    """Insert the line or increment its quantity in one atomic INSERT ... ON CONFLICT.
+
+    Raises ProductUnavailableError or OutOfStockError when nothing was written.
+    """
     result = await db.execute(
-        select(Cart).filter(
-            Cart.user_id == user_id,
-            Cart.product_id == product_id
-        )
+        _CART_UPSERT, {"user_id": user_id, "product_id": product_id, "quantity": quantity}
     )
     cart_item = result.scalar_one_or_none()
-
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = Cart(
-            user_id=user_id,
-            product_id=product_id,
-            quantity=quantity
-        )
-        db.add(cart_item)
-
+    if cart_item is None:
+        await db.rollback()
+        is_active = (await db.execute(select(Product.is_active).filter(Product.id == product_id))).scalar()
+        if not is_active:
+            raise ProductUnavailableError(f"Product {product_id} is not available")
+        raise OutOfStockError([product_id])
     await db.commit()
-    await db.refresh(cart_item)
+    note_cart_write(user_id)
     return cart_item
 
 
 async def remove_from_cart(db: AsyncSession, user_id: int, product_id: int):
-    result = await db.execute(
-        select(Cart).filter(
-            Cart.user_id == user_id,
-            Cart.product_id == product_id
-        )
-    )
-    cart_item = result.scalar_one_or_none()
-    if cart_item:
-        await db.delete(cart_item)
-        await db.commit()
+    result = await db.execute(_CART_REMOVE, {"user_id": user_id, "product_id": product_id})
+    cart_item = result.first()
+    await db.commit()
+    note_cart_write(user_id)
     return cart_item
 
 
 async def clear_cart(db: AsyncSession, user_id: int):
-    result = await db.execute(select(Cart).filter(Cart.user_id == user_id))
-    cart_items = result.scalars().all()
-    for item in cart_items:
-        await db.delete(item)
+    result = await db.execute(_CART_CLEAR, {"user_id": user_id})
+    count = result.scalar_one()
     await db.commit()
-    return len(cart_items)
+    note_cart_write(user_id)
+    return count
 
 
 async def get_cart_items(db: AsyncSession, user_id: int):
-    result = await db.execute(select(Cart).filter(Cart.user_id == user_id))
-    return result.scalars().all()
+    """Cart lines as CartItem schemas built from plain rows, without ORM hydration"""
+    stmt = lambda_stmt(lambda: select(Cart.id, Cart.user_id, Cart.product_id, Cart.quantity)
+                       .filter(Cart.user_id == user_id))
+    result = await db.execute(stmt, bind_arguments=replica_bind(user_id))
+    return CartItemList.validate_python(result.mappings().all())
+
+
+async def get_cart_summary(db: AsyncSession, user_id: int) -> CartTotal:
+    """Item count, total and version of the user's cart: a primary-key read of cart_summaries"""
+    summary = cart_summary_cache.get(user_id)
+    if summary is not None:
+        return summary
+
+    stmt = lambda_stmt(lambda: select(CartSummary.total, CartSummary.item_count, CartSummary.version)
+                       .filter(CartSummary.user_id == user_id))
+    result = await db.execute(stmt, bind_arguments=replica_bind(user_id))
+    row = result.mappings().first()
+    if row is not None:
+        summary = CartTotal.model_validate(row)
+    else:
+        # No summary yet (no cart writes since it was introduced): aggregate on the fly
+        stmt = lambda_stmt(lambda: select(
+            func.coalesce(func.sum(Product.price * Cart.quantity), 0).label("total"),
+            func.coalesce(func.sum(Cart.quantity), 0).label("item_count"),
+        )
+            .select_from(Cart.__table__.join(Product.__table__))
+            .filter(Cart.user_id == user_id, Product.is_active == True))
+        result = await db.execute(stmt, bind_arguments=replica_bind(user_id))
+        summary = CartTotal(**result.mappings().one(), version=0)
+
+    stmt = lambda_stmt(lambda: select(Cart.product_id).filter(Cart.user_id == user_id))
+    product_ids = (await db.execute(stmt, bind_arguments=replica_bind(user_id))).scalars().all()
+    cart_summary_cache.set(user_id, summary, tags=product_ids)
+    return summary
 
 
 async def get_cart_total(db: AsyncSession, user_id: int):
-    result = await db.execute(
-        select(func.sum(Product.price * Cart.quantity))
-        .select_from(Cart.__table__.join(Product.__table__))
-        .filter(Cart.user_id == user_id)
+    return (await get_cart_summary(db, user_id)).total
+
+
+class CartFanout:
+    """Refreshes cart summaries after product price/availability changes.
+
+    The product write calls mark_pending() in its own transaction, so the
+    change is recorded in cart_fanout_pending even if this process dies before
+    the fanout runs. notify() then drops this worker's cached summaries for
+    the product right away (via the cache's product -> users reverse index)
+    and queues the product. The background worker drains the queue in small
+    time windows, so bursts of updates are coalesced into one pass, and
+    recomputes persisted summaries of affected users only, in chunks of
+    chunk_size users, each in its own short transaction. A failed pass is
+    retried with exponential backoff; on start the worker picks up products
+    left pending by a previous process, and on stop it finishes queued work
+    inline. Without a running worker (tests, scripts) the refresh runs inline
+    in the caller's session.
+    """
+
+    def __init__(self, chunk_size: int, batch_seconds: float, max_retry_seconds: float):
+        self.chunk_size = chunk_size
+        self.batch_seconds = batch_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.batches = 0
+        self.failures = 0
+        self.users_refreshed = 0
+        self.latency = LatencyHistogram()
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        # Products taken off the queue whose refresh has not succeeded yet
+        self._batch: set[int] = set()
+
+    async def mark_pending(self, db: AsyncSession, product_id: int):
+        """Record the product for fanout; call before committing the product change"""
+        await db.execute(_FANOUT_MARK_PENDING, {"product_id": product_id})
+
+    async def notify(self, db: AsyncSession, product_id: int):
+        cart_summary_cache.invalidate_tag(product_id)
+        if self._task is not None and not self._task.done():
+            self._queue.put_nowait(product_id)
+        else:
+            await self.refresh(db, [product_id])
+
+    async def refresh(self, db: AsyncSession, product_ids) -> int:
+        """Recompute summaries of every cart holding one of the products"""
+        started = time.perf_counter()
+        product_ids = list(product_ids)
+        # Changes committed after this read bump the generation and stay pending
+        seen = (await db.execute(
+            select(CartFanoutPending.product_id, CartFanoutPending.generation)
+            .filter(CartFanoutPending.product_id.in_(product_ids))
+        )).all()
+        refreshed, after_user_id = 0, 0
+        while True:
+            user_ids = (await db.execute(_AFFECTED_USERS, {
+                "product_ids": product_ids, "after_user_id": after_user_id, "chunk_size": self.chunk_size,
+            })).scalars().all()
+            if not user_ids:
+                break
+            await db.execute(_SUMMARY_REFRESH_USERS, {"user_ids": list(user_ids)})
+            await db.commit()
+            for user_id in user_ids:
+                cart_summary_cache.pop(user_id)
+            refreshed += len(user_ids)
+            after_user_id = user_ids[-1]
+        if seen:
+            await db.execute(_FANOUT_DONE, {
+                "product_ids": [row.product_id for row in seen], "generations": [row.generation for row in seen],
+            })
+        await db.commit()
+        self.batches += 1
+        self.users_refreshed += refreshed
+        self.latency.observe(time.perf_counter() - started)
+        return refreshed
+
+    def _drain(self):
+        while not self._queue.empty():
+            self._batch.add(self._queue.get_nowait())
+
+    async def _run(self):
+        recovered, attempts = False, 0
+        while True:
+            if recovered and not self._batch:
+                self._batch.add(await self._queue.get())
+                await asyncio.sleep(self.batch_seconds)
+            self._drain()
+            try:
+                async with AsyncSessionLocal() as db:
+                    if not recovered:
+                        # Left pending by a process that stopped before finishing its fanout
+                        self._batch.update((await db.execute(select(CartFanoutPending.product_id))).scalars())
+                        recovered = True
+                    if self._batch:
+                        await self.refresh(db, sorted(self._batch))
+                self._batch.clear()
+                attempts = 0
+            except Exception as e:
+                self.failures += 1
+                attempts += 1
+                delay = min(self.batch_seconds * 2 ** attempts, self.max_retry_seconds)
+                logger.error(
+                    f"Cart summary fanout failed for products {sorted(self._batch)}, retrying in {delay:.2f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+
+    def start(self):
+        if AsyncSessionLocal is None or (self._task is not None and not self._task.done()):
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # Finish what was queued; whatever still fails stays in cart_fanout_pending
+            self._drain()
+            if self._batch:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await self.refresh(db, sorted(self._batch))
+                    self._batch.clear()
+                except Exception as e:
+                    logger.error(f"Cart summary fanout for products {sorted(self._batch)} left pending: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "retrying": len(self._batch),
+            "batches": self.batches,
+            "failures": self.failures,
+            "users_refreshed": self.users_refreshed,
+            "latency_seconds": self.latency.snapshot(),
+        }
+
+
+cart_fanout = CartFanout(
+    settings.CART_FANOUT_CHUNK_SIZE, settings.CART_FANOUT_BATCH_SECONDS, settings.CART_FANOUT_MAX_RETRY_SECONDS,
+)
+register_collector("cart_fanout", cart_fanout.stats)
+
+
+async def get_cart_view(db: AsyncSession, user_id: int):
+    """Lines of active products with details, line totals and the grand total in one query"""
+    stmt = lambda_stmt(lambda: select(
+        Cart.product_id,
+        Product.name,
+        Product.price,
+        Cart.quantity,
+        (Product.price * Cart.quantity).label("line_total"),
+        func.sum(Product.price * Cart.quantity).over().label("cart_total"),
     )
-    total = result.scalar()
-    return total or 0
\ No newline at end of file
+        .join(Product, Product.id == Cart.product_id)
+        .filter(Cart.user_id == user_id, Product.is_active == True)
+        .order_by(Cart.id))
+    result = await db.execute(stmt, bind_arguments=replica_bind(user_id))
+    lines = result.mappings().all()
+    return {"items": lines, "total": lines[0]["cart_total"] if lines else 0}
+
+
+def _collapse_operations(operations) -> dict:
+    """Fold ordered batch operations into one final effect per product.
+
+    Effects are ("add", n) relative to the stored quantity, ("set", n) absolute,
+    or ("remove", 0).
+    """
+    effects = {}
+    for operation in operations:
+        kind, amount = effects.get(operation.product_id, (None, 0))
+        if operation.op == "add":
+            if kind == "set":
+                effect = ("set", amount + operation.quantity)
+            elif kind == "remove":
+                effect = ("set", operation.quantity)
+            else:
+                effect = ("add", amount + operation.quantity)
+        elif operation.op == "set":
+            effect = ("set", operation.quantity)
+        else:
+            effect = ("remove", 0)
+        if effect[0] == "set" and effect[1] == 0:
+            effect = ("remove", 0)
+        effects[operation.product_id] = effect
+    return effects
+
+
+async def apply_cart_batch(db: AsyncSession, user_id: int, operations):
+    """Apply add/set/remove operations in one transaction with one statement per kind.
+
+    Raises ProductUnavailableError if an added or set product does not exist
+    or is not active, or OutOfStockError if a resulting line needs more than
+    the product's stock (nothing is written then).
+    """
+    effects = _collapse_operations(operations)
+    adds = [
+        {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+        for product_id, (kind, quantity) in effects.items() if kind == "add" and quantity > 0
+    ]
+    sets = [
+        {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+        for product_id, (kind, quantity) in effects.items() if kind == "set"
+    ]
+    removes = [product_id for product_id, (kind, _) in effects.items() if kind == "remove"]
+
+    wanted = sorted({line["product_id"] for line in adds + sets})
+    if wanted:
+        # Share locks in id order keep these products from being deactivated,
+        # archived or repriced until the batch commits
+        available = set((await db.execute(
+            select(Product.id)
+            .filter(Product.id.in_(wanted), Product.is_active == True)
+            .order_by(Product.id)
+            .with_for_update(read=True)
+        )).scalars())
+        unavailable = [product_id for product_id in wanted if product_id not in available]
+        if unavailable:
+            await db.rollback()
+            raise ProductUnavailableError(f"Products {unavailable} are not available")
+
+    if adds:
+        stmt = pg_insert(Cart).values(adds)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[Cart.user_id, Cart.product_id],
+            set_={"quantity": Cart.quantity + stmt.excluded.quantity},
+        ))
+    if sets:
+        stmt = pg_insert(Cart).values(sets)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[Cart.user_id, Cart.product_id],
+            set_={"quantity": stmt.excluded.quantity},
+        ))
+    if removes:
+        await db.execute(
+            delete(Cart).where(Cart.user_id == user_id, Cart.product_id.in_(removes)),
+            execution_options={"synchronize_session": False},
+        )
+    if wanted:
+        # Same soft check as add_to_cart, on the quantities the batch ends up with
+        short = (await db.execute(
+            select(Cart.product_id)
+            .join(Product, Product.id == Cart.product_id)
+            .filter(Cart.user_id == user_id, Cart.product_id.in_(wanted), Cart.quantity > Product.stock)
+            .order_by(Cart.product_id)
+        )).scalars().all()
+        if short:
+            await db.rollback()
+            raise OutOfStockError(short)
+    await db.execute(_SUMMARY_REFRESH, {"user_id": user_id})
+    await db.commit()
+    note_cart_write(user_id)
+
+    return await get_cart_items(db, user_id)
@@ -0,0 +1,115 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import text
+from app.crud.cart import OutOfStockError, note_cart_write
+from app.crud.product import catalog_cache
+from app.models.order import Order, OrderItem
+from app.schemas.order import Order as OrderSchema
+
+
+class EmptyCartError(Exception):
+    """Checkout of a cart with no orderable lines"""
+
+
+_ORDER_INSERT = text("""
+    INSERT INTO orders (user_id, status, total, idempotency_key)
+    VALUES (:user_id, 'placed', 0, :idempotency_key)
+    ON CONFLICT (user_id, idempotency_key) DO NOTHING
+    RETURNING id
+""")
+
+# One statement moves the cart into the order. Product rows are locked in id
+# order first, so checkouts sharing several products queue up instead of
+# deadlocking, then stock is reserved with a conditional decrement (stock >=
+# quantity is checked against the row version we now hold), reserved lines are
+# deleted from the cart, copied into order_items with a snapshot of name and
+# price, and summed into the order total. Lines of inactive products stay in
+# the cart; lines that could not be reserved are returned as short. Lines
+# with a non-positive quantity are never ordered (they would add stock back).
+_CART_TO_ORDER = text("""
+    WITH lines AS (
+        SELECT carts.product_id, carts.quantity
+        FROM carts
+        JOIN products ON products.id = carts.product_id
+        WHERE carts.user_id = :user_id AND products.is_active AND carts.quantity > 0
+        FOR UPDATE OF carts
+    ), locked AS (
+        SELECT products.id, lines.quantity
+        FROM products
+        JOIN lines ON lines.product_id = products.id
+        ORDER BY products.id
+        FOR UPDATE OF products
+    ), reserved AS (
+        UPDATE products
+        SET stock = products.stock - locked.quantity
+        FROM locked
+        WHERE products.id = locked.id AND products.stock >= locked.quantity
+        RETURNING products.id, products.name, products.price, locked.quantity
+    ), taken AS (
+        DELETE FROM carts
+        USING reserved
+        WHERE carts.user_id = :user_id AND carts.product_id = reserved.id
+    ), summary AS (
+        -- Only lines of inactive products can remain, and summaries exclude those
+        UPDATE cart_summaries
+        SET item_count = 0, total = 0, version = cart_summaries.version + 1
+        WHERE user_id = :user_id
+    ), items AS (
+        INSERT INTO order_items (order_id, product_id, product_name, unit_price, quantity)
+        SELECT :order_id, id, name, price, quantity FROM reserved
+        RETURNING unit_price * quantity AS line_total
+    )
+    UPDATE orders
+    SET total = (SELECT coalesce(sum(line_total), 0) FROM items)
+    WHERE id = :order_id
+    RETURNING
+        (SELECT count(*) FROM lines) AS line_count,
+        ARRAY(SELECT product_id FROM lines WHERE product_id NOT IN (SELECT id FROM reserved)) AS short
+""")
+
+
+async def get_order(db: AsyncSession, order_id: int) -> OrderSchema:
+    order = (await db.execute(
+        select(Order.id, Order.status, Order.total, Order.created_at).filter(Order.id == order_id)
+    )).mappings().one()
+    items = (await db.execute(
+        select(OrderItem.product_id, OrderItem.product_name, OrderItem.unit_price, OrderItem.quantity)
+        .filter(OrderItem.order_id == order_id)
+        .order_by(OrderItem.id)
+    )).mappings().all()
+    return OrderSchema(**order, items=items)
+
+
+async def checkout(db: AsyncSession, user_id: int, idempotency_key: str | None = None):
+    """Turn the user's cart into an order in one transaction.
+
+    Returns (order, replayed); replayed is True when idempotency_key already
+    produced an order, which is returned unchanged. Raises EmptyCartError, or
+    OutOfStockError if any line cannot be reserved (nothing is ordered then).
+    """
+    order_id = (await db.execute(
+        _ORDER_INSERT, {"user_id": user_id, "idempotency_key": idempotency_key}
+    )).scalar()
+    if order_id is None:
+        # A concurrent request with the same key waits on the unique index until
+        # the first commits, so the existing order is visible here
+        await db.rollback()
+        order_id = (await db.execute(
+            select(Order.id).filter(Order.user_id == user_id, Order.idempotency_key == idempotency_key)
+        )).scalar_one()
+        return await get_order(db, order_id), True
+
+    outcome = (await db.execute(_CART_TO_ORDER, {"user_id": user_id, "order_id": order_id})).one()
+    if not outcome.line_count:
+        await db.rollback()
+        raise EmptyCartError("Cart is empty")
+    if outcome.short:
+        await db.rollback()
+        raise OutOfStockError(outcome.short)
+
+    # Commit straight away: the stock row locks are held only for this statement and the commit
+    await db.commit()
+    note_cart_write(user_id)
+    # Cached listings and product pages carry stock
+    await catalog_cache.invalidate()
+    return await get_order(db, order_id), False
@@ -1,39 +1,345 @@
+import asyncio
+import logging
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import Numeric, and_, cast, func, lambda_stmt, literal, or_, text, tuple_
+from app.core.cache import ReadThroughCache, TTLCache, shared_cache_backend
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, replica_bind
+from app.core.metrics import register_collector
+from app.crud.cart import cart_fanout
 from app.models.product import Product
+from app.schemas.product import Product as ProductSchema, ProductList
+
+logger = logging.getLogger(__name__)
+
+# Catalog reads are cached as schema objects (never session-bound ORM rows)
+# and the whole namespace is invalidated by any product write.
+# List reads select plain columns, so no ORM identity-map objects are built.
+catalog_cache = ReadThroughCache(
+    "catalog", shared_cache_backend, settings.CATALOG_CACHE_MAX_SIZE, settings.CATALOG_CACHE_TTL_SECONDS
+)
+register_collector("catalog_cache", catalog_cache.stats)
+
+# (catalog generation, term, limit, after) -> search page; keyed by generation so
+# catalog writes retire it like catalog_cache. (generation, "empty", term) marks
+# terms with no matches: any longer query containing them has none either.
+search_cache = TTLCache(settings.SEARCH_CACHE_MAX_SIZE, settings.SEARCH_CACHE_TTL_SECONDS)
+register_collector("search_cache", search_cache.stats)
+
+
+# Sort key -> column; each is paired with id for a stable keyset order and
+# backed by a partial (column, id) index over active products
+SORT_COLUMNS = {
+    "id": Product.id,
+    "price": Product.price,
+    "created_at": Product.created_at,
+    "name": Product.name,
+}
+
+def products_query(
+    after: tuple | None = None,
+    *,
+    sort: str = "id",
+    min_price: Decimal | None = None,
+    max_price: Decimal | None = None,
+    created_after: datetime | None = None,
+    include_inactive: bool = False,
+):
+    """Filtered, keyset-ordered SELECT behind get_products (without offset/limit)"""
+    descending = sort.startswith("-")
+    column = SORT_COLUMNS[sort.lstrip("-")]
+
+    query = select(*Product.__table__.columns)
+    if not include_inactive:
+        query = query.filter(Product.is_active == True)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    if created_after is not None:
+        query = query.filter(Product.created_at > created_after)
+
+    if column is Product.id:
+        keys = (Product.id,)
+        position = after[1:] if after is not None else None
+    else:
+        keys = (column, Product.id)
+        position = after
+    if position is not None:
+        row, value = tuple_(*keys), tuple_(*position)
+        query = query.filter(row < value if descending else row > value)
+
+    return query.order_by(*(key.desc() for key in keys) if descending else keys)
+
+async def get_products(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after: tuple | None = None,
+    *,
+    sort: str = "id",
+    min_price: Decimal | None = None,
+    max_price: Decimal | None = None,
+    created_after: datetime | None = None,
+    include_inactive: bool = False,
+):
+    """Products filtered and ordered by sort ("price", or "-price" for descending), then id.
+
+    Pass after=(sort value, id) of the last row for keyset pagination instead of skip.
+    """
+    async def load():
+        query = products_query(
+            after, sort=sort, min_price=min_price, max_price=max_price,
+            created_after=created_after, include_inactive=include_inactive,
+        )
+        result = await db.execute(query.offset(skip).limit(limit), bind_arguments=replica_bind())
+        return ProductList.validate_python(result.mappings().all())
+
+    key = f"products:{sort}:{skip}:{limit}:{after}:{min_price}:{max_price}:{created_after}:{include_inactive}"
+    return await catalog_cache.get_or_load(key, load)
+
+async def stream_products(db: AsyncSession, batch_size: int = 1000):
+    """Every product (inactive included) in id order, yielded in batches of row mappings.
+
+    Uses a server-side cursor, so memory stays flat regardless of catalog size.
+    """
+    query = select(*Product.__table__.columns).order_by(Product.id).execution_options(yield_per=batch_size)
+    result = await db.stream(query, bind_arguments=replica_bind())
+    async for batch in result.mappings().partitions():
+        yield batch
+
+# Whether pg_trgm is installed; checked once per process. Without it search is
+# a plain ILIKE over active products, every row ranked 0 (so ordered by id).
+_trigram_search: bool | None = None
+
+async def trigram_search_available(db: AsyncSession) -> bool:
+    global _trigram_search
+    if _trigram_search is None:
+        result = await db.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"), bind_arguments=replica_bind()
+        )
+        _trigram_search = result.scalar() is not None
+        if not _trigram_search:
+            logger.warning("pg_trgm is not installed; product search falls back to unranked ILIKE")
+    return _trigram_search
+
+def normalize_search_term(q: str) -> str:
+    return " ".join(q.lower().split())
+
+async def search_products(db: AsyncSession, q: str, limit: int = 20, after: tuple[Decimal, int] | None = None):
+    """Active products whose name contains q, best trigram similarity first (id order without pg_trgm).
+
+    Returns (products, next position); pass the position back as after for the
+    next page. Positions are (rank, id), rank being similarity rounded to 4 places.
+    """
+    term = normalize_search_term(q)
+    if not term:
+        return [], None
+
+    generation = await catalog_cache.generation()
+    if after is None and any(
+        search_cache.get((generation, "empty", term[:end])) for end in range(1, len(term) + 1)
+    ):
+        return [], None
+
+    key = (generation, term, limit, after)
+    page = search_cache.get(key)
+    if page is not None:
+        return page
+
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if await trigram_search_available(db):
+        rank = func.round(cast(func.similarity(Product.name, term), Numeric), 4)
+    else:
+        rank = literal(Decimal(0), Numeric)
+    query = select(*Product.__table__.columns, rank.label("rank")).filter(
+        Product.is_active == True, Product.name.ilike(f"%{escaped}%", escape="\\")
+    )
+    if after is not None:
+        after_rank, after_id = after
+        query = query.filter(or_(rank < after_rank, and_(rank == after_rank, Product.id > after_id)))
+    result = await db.execute(
+        query.order_by(rank.desc(), Product.id).limit(limit), bind_arguments=replica_bind()
+    )
+    rows = result.mappings().all()
 
-async def get_products(db: AsyncSession, skip: int = 0, limit: int = 100):
-    result = await db.execute(select(Product).filter(Product.is_active == True).offset(skip).limit(limit))
-    return result.scalars().all()
+    products = ProductList.validate_python(rows)
+    next_position = (rows[-1]["rank"], rows[-1]["id"]) if len(rows) == limit else None
+    page = (products, next_position)
+    search_cache.set(key, page)
+    if not rows and after is None:
+        search_cache.set((generation, "empty", term), True)
+    return page
 
 async def get_product(db: AsyncSession, product_id: int):
-    result = await db.execute(select(Product).filter(Product.id == product_id))
-    return result.scalar_one_or_none()
+    async def load():
+        stmt = lambda_stmt(lambda: select(Product).filter(Product.id == product_id))
+        result = await db.execute(stmt, bind_arguments=replica_bind())
+        db_product = result.scalar_one_or_none()
+        return ProductSchema.model_validate(db_product) if db_product else None
+
+    return await catalog_cache.get_or_load(f"product:{product_id}", load)
 
 async def create_product(db: AsyncSession, product_data):
     db_product = Product(
         name=product_data.name,
-        price=product_data.price
+        price=product_data.price,
+        stock=product_data.stock
     )
     db.add(db_product)
     await db.commit()
     await db.refresh(db_product)
+    await catalog_cache.invalidate()
     return db_product
 
+async def copy_products(db: AsyncSession, products) -> int:
+    """Bulk-load validated ProductCreate rows with COPY inside the session's transaction.
+
+    The caller commits and then invalidates the catalog cache.
+    """
+    if not products:
+        return 0
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    # COPY skips column defaults from the model, so is_active is sent explicitly
+    await raw_connection.driver_connection.copy_records_to_table(
+        Product.__tablename__,
+        records=[(p.name, p.price, p.stock, True) for p in products],
+        columns=["name", "price", "stock", "is_active"],
+    )
+    return len(products)
+
 async def update_product(db: AsyncSession, product_id: int, product_data):
     result = await db.execute(select(Product).filter(Product.id == product_id))
     db_product = result.scalar_one_or_none()
     if db_product:
+        priced_before = (db_product.price, db_product.is_active)
         for key, value in product_data.dict(exclude_unset=True).items():
             setattr(db_product, key, value)
+        repriced = (db_product.price, db_product.is_active) != priced_before
+        if repriced:
+            await cart_fanout.mark_pending(db, product_id)
         await db.commit()
         await db.refresh(db_product)
+        await catalog_cache.invalidate()
+        if repriced:
+            await cart_fanout.notify(db, product_id)
     return db_product
 
 async def delete_product(db: AsyncSession, product_id: int):
+    """Soft delete: the product leaves listings and cart totals; the archiver removes it later"""
     result = await db.execute(select(Product).filter(Product.id == product_id))
     db_product = result.scalar_one_or_none()
-    if db_product:
-        await db.delete(db_product)
+    if db_product and db_product.is_active:
+        db_product.is_active = False
+        await cart_fanout.mark_pending(db, product_id)
+        await db.commit()
+        await db.refresh(db_product)
+        await catalog_cache.invalidate()
+        await cart_fanout.notify(db, product_id)
+    return db_product
+
+
+# One batch: lock inactive products past the cutoff (skipping rows another
+# archiver holds), drop their cart lines, and move them to products_archive.
+# FK checks run at the end of the statement, after the cart lines are gone.
+_ARCHIVE_BATCH = text("""
+    WITH doomed AS (
+        SELECT id FROM products
+        WHERE is_active = false
+          AND coalesce(updated_at, created_at) < now() - make_interval(days => :after_days)
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ), cart_lines AS (
+        DELETE FROM carts USING doomed WHERE carts.product_id = doomed.id
+    ), moved AS (
+        DELETE FROM products USING doomed WHERE products.id = doomed.id
+        RETURNING products.id, products.name, products.price, products.stock,
+                  products.created_at, products.updated_at
+    )
+    INSERT INTO products_archive (id, name, price, stock, created_at, updated_at)
+    SELECT id, name, price, stock, created_at, updated_at FROM moved
+    RETURNING id
+""")
+
+async def archive_inactive_products(db: AsyncSession, after_days: int, batch_size: int = 1000) -> int:
+    """Move products inactive for after_days into products_archive, one committed batch at a time"""
+    archived = 0
+    while True:
+        result = await db.execute(_ARCHIVE_BATCH, {"after_days": after_days, "batch_size": batch_size})
+        moved = len(result.all())
         await db.commit()
-    return db_product
\ No newline at end of file
+        archived += moved
+        if moved < batch_size:
+            break
+    if archived:
+        await catalog_cache.invalidate()
+    return archived
+
+
+class ProductArchiver:
+    """Background job running archive_inactive_products every interval seconds.
+
+    A failed run (earlier batches stay committed) is retried after
+    retry_seconds, doubling up to interval, instead of waiting a full interval.
+    """
+
+    def __init__(self, after_days: int, batch_size: int, interval: float, retry_seconds: float):
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retry_seconds = retry_seconds
+        self.runs = 0
+        self.failures = 0
+        self.archived = 0
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        attempts = 0
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    self.archived += await archive_inactive_products(db, self.after_days, self.batch_size)
+                self.runs += 1
+                attempts = 0
+                delay = self.interval
+            except Exception as e:
+                self.failures += 1
+                attempts += 1
+                delay = min(self.retry_seconds * 2 ** (attempts - 1), self.interval)
+                logger.error(f"Product archival failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+
+    def start(self):
+        if AsyncSessionLocal is None or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "archived": self.archived,
+        }
+
+
+product_archiver = ProductArchiver(
+    settings.PRODUCT_ARCHIVE_AFTER_DAYS, settings.PRODUCT_ARCHIVE_BATCH_SIZE, settings.PRODUCT_ARCHIVE_INTERVAL_SECONDS,
+    settings.PRODUCT_ARCHIVE_RETRY_SECONDS,
+)
+register_collector("product_archiver", product_archiver.stats)
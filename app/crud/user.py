@@ -1,32 +1,37 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import or_
+from sqlalchemy import lambda_stmt, or_
+from app.core.database import replica_bind
 from app.models.user import User
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash_async, principal_cache
+
+# Hot lookups are lambda statements: built and cache-keyed once, later calls only bind new values
 
 async def get_user(db: AsyncSession, user_id: int):
-    result = await db.execute(select(User).filter(User.id == user_id))
+    stmt = lambda_stmt(lambda: select(User).filter(User.id == user_id))
+    result = await db.execute(stmt, bind_arguments=replica_bind())
     return result.scalar_one_or_none()
 
 async def get_user_by_email(db: AsyncSession, email: str):
-    result = await db.execute(select(User).filter(User.email == email))
+    stmt = lambda_stmt(lambda: select(User).filter(User.email == email))
+    result = await db.execute(stmt, bind_arguments=replica_bind())
     return result.scalar_one_or_none()
 
 async def get_user_by_phone(db: AsyncSession, phone: str):
-    result = await db.execute(select(User).filter(User.phone == phone))
+    stmt = lambda_stmt(lambda: select(User).filter(User.phone == phone))
+    result = await db.execute(stmt, bind_arguments=replica_bind())
     return result.scalar_one_or_none()
 
 async def get_user_by_login(db: AsyncSession, login: str):
     """Get user by email or phone"""
-    result = await db.execute(
-        select(User).filter(
-            or_(User.email == login, User.phone == login)
-        )
-    )
+    stmt = lambda_stmt(lambda: select(User).filter(
+        or_(User.email == login, User.phone == login)
+    ))
+    result = await db.execute(stmt, bind_arguments=replica_bind())
     return result.scalar_one_or_none()
 
 async def create_user(db: AsyncSession, user_data):
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     db_user = User(
         full_name=user_data.full_name,
         email=user_data.email,
@@ -36,4 +41,17 @@ async def create_user(db: AsyncSession, user_data):
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+async def update_user_status(db: AsyncSession, user_id: int, is_active: bool | None = None, is_admin: bool | None = None):
+    """Activate/deactivate or promote/demote a user and retire cached principals in every worker"""
+    db_user = await db.get(User, user_id)
+    if db_user:
+        if is_active is not None:
+            db_user.is_active = is_active
+        if is_admin is not None:
+            db_user.is_admin = is_admin
+        await db.commit()
+        await db.refresh(db_user)
+        await principal_cache.invalidate()
+    return db_user
@@ -1,9 +1,17 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import logging
 
 from app.api import auth, products, cart
+from app.core.config import settings
 from app.core.database import create_db_and_tables, test_connection
+from app.core.dependencies import get_current_admin_user
+from app.crud.cart import cart_fanout
+from app.crud.product import product_archiver
+from app.core.metrics import collect_metrics
+from app.core.responses import FastJSONResponse
+from app.core.security import HashingPoolSaturated
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -12,7 +20,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Shopping Service API",
     description="API для сервиса покупки товаров",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -29,6 +38,14 @@ app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(products.router, prefix="/products", tags=["products"])
 app.include_router(cart.router, prefix="/cart", tags=["cart"])
 
+@app.exception_handler(HashingPoolSaturated)
+async def hashing_pool_saturated_handler(request: Request, exc: HashingPoolSaturated):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many authentication requests, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting application...")
@@ -37,7 +54,10 @@ async def startup_event():
         connection_ok = await test_connection()
         if connection_ok:
             logger.info("Database connection successful")
-            await create_db_and_tables()
+            if settings.DB_CREATE_ALL_ON_STARTUP:
+                await create_db_and_tables()
+            cart_fanout.start()
+            product_archiver.start()
             logger.info("Application started successfully")
         else:
             logger.warning("Database connection failed, starting without database")
@@ -45,6 +65,11 @@ async def startup_event():
         logger.error(f"Error during startup: {e}")
         logger.info("Application will start without database connectivity")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await cart_fanout.stop()
+    await product_archiver.stop()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Shopping Service API"}
@@ -57,6 +82,11 @@ async def health_check():
         "database": "connected" if connection_ok else "disconnected"
     }
 
+@app.get("/metrics", dependencies=[Depends(get_current_admin_user)])
+async def metrics():
+    """Pool, cache and hashing stats; admins only, since they reveal load and capacity"""
+    return collect_metrics()
+
 @app.get("/test-db")
 async def test_db():
     """Тестовый эндпоинт для проверки подключения к БД"""
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, BigInteger, ForeignKey, DateTime, Numeric, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -9,4 +9,37 @@ class Cart(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, default=1)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # One line per product in a user's cart; target of the add_to_cart upsert
+        UniqueConstraint("user_id", "product_id", name="uq_carts_user_product"),
+        # Reverse index product -> carts: FK lookups and price-change fanout, index-only in user_id order
+        Index("ix_carts_product_user", "product_id", "user_id"),
+    )
+
+
+class CartSummary(Base):
+    """Per-user cart aggregate over active products, kept in step with every cart write"""
+    __tablename__ = "cart_summaries"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    item_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total = Column(Numeric(12, 2), nullable=False, default=0, server_default="0")
+    # Bumped on every change; clients use it for conditional GETs
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+
+class CartFanoutPending(Base):
+    """Products whose cart summary refresh has not finished yet.
+
+    Written in the same transaction as the price/availability change and
+    removed once the fanout is done, so a crash in between is recovered on the
+    next start. generation is bumped on every change, so a refresh only clears
+    the changes it has seen.
+    """
+    __tablename__ = "cart_fanout_pending"
+
+    product_id = Column(Integer, primary_key=True)
+    generation = Column(BigInteger, nullable=False, default=1, server_default="1")
+    queued_at = Column(DateTime(timezone=True), server_default=func.now())
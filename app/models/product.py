@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, Index, CheckConstraint
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -9,5 +9,36 @@ class Product(Base):
     name = Column(String, nullable=False)
     price = Column(Numeric(10, 2), nullable=False)
     is_active = Column(Boolean, default=True)
+    # Units available to sell; only ever decremented with a conditional UPDATE
+    stock = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        CheckConstraint("stock >= 0", name="ck_products_stock_non_negative"),
+        # Backs keyset pagination over active products (WHERE is_active ORDER BY id)
+        Index("ix_products_active_id", "id", postgresql_where=(is_active == True)),
+        # Soft-deleted products awaiting archival, scanned in id batches by the archiver
+        Index("ix_products_inactive_id", "id", postgresql_where=(is_active == False)),
+        # Sorted listings: keyset over (sort column, id), scanned backwards for descending sorts
+        Index("ix_products_active_price_id", "price", "id", postgresql_where=(is_active == True)),
+        Index("ix_products_active_created_at_id", "created_at", "id", postgresql_where=(is_active == True)),
+        Index("ix_products_active_name_id", "name", "id", postgresql_where=(is_active == True)),
+        # The pg_trgm GIN index over active names (ix_products_name_trgm) is created only by
+        # migration 0003, so create_all keeps working on servers without the extension
+    )
+
+
+
+class ProductArchive(Base):
+    """Long-inactive products moved out of the live table by the archiver"""
+    __tablename__ = "products_archive"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    price = Column(Numeric(10, 2), nullable=False)
+    stock = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
@@ -1,15 +1,16 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter
 from decimal import Decimal
+from typing import List, Literal
 
 class CartItemBase(BaseModel):
     product_id: int
-    quantity: int = 1
+    quantity: int = Field(1, ge=1)
 
 class CartItemCreate(CartItemBase):
     pass
 
 class CartItemUpdate(BaseModel):
-    quantity: int
+    quantity: int = Field(..., ge=1)
 
 class CartItem(CartItemBase):
     id: int
@@ -18,5 +19,28 @@ class CartItem(CartItemBase):
     class Config:
         from_attributes = True
 
+CartItemList = TypeAdapter(List[CartItem])
+
 class CartTotal(BaseModel):
-    total: Decimal
\ No newline at end of file
+    total: Decimal
+    item_count: int
+    version: int
+
+class CartLine(BaseModel):
+    product_id: int
+    name: str
+    price: Decimal
+    quantity: int
+    line_total: Decimal
+
+class CartView(BaseModel):
+    items: List[CartLine]
+    total: Decimal
+
+class CartBatchOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    product_id: int
+    quantity: int = Field(1, ge=0)
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartBatchOperation] = Field(..., max_length=500)
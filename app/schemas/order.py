@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from datetime import datetime
+from decimal import Decimal
+from typing import List
+
+class OrderItem(BaseModel):
+    product_id: int | None
+    product_name: str
+    unit_price: Decimal
+    quantity: int
+
+    class Config:
+        from_attributes = True
+
+class Order(BaseModel):
+    id: int
+    status: str
+    total: Decimal
+    created_at: datetime
+    items: List[OrderItem]
@@ -1,22 +1,33 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter
 from datetime import datetime
 from decimal import Decimal
+from typing import List
+
+# Bounds of the products columns (Numeric(10, 2) and a 32-bit integer), so that
+# out-of-range values are reported per row instead of failing a whole COPY
+MAX_STOCK = 2_147_483_647
 
 class ProductBase(BaseModel):
     name: str
-    price: Decimal
+    price: Decimal = Field(..., max_digits=10, decimal_places=2)
 
 class ProductCreate(ProductBase):
-    pass
+    # Required: a product created without stock could never be added to a cart
+    stock: int = Field(..., ge=0, le=MAX_STOCK)
 
 class ProductUpdate(ProductBase):
     is_active: bool | None = None
+    stock: int | None = Field(None, ge=0, le=MAX_STOCK)
 
 class Product(ProductBase):
     id: int
     is_active: bool
+    stock: int
     created_at: datetime
     updated_at: datetime | None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Validates row mappings and serializes straight to JSON bytes, skipping ORM objects
+ProductList = TypeAdapter(List[Product])
@@ -46,6 +46,10 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserStatusUpdate(BaseModel):
+    is_active: bool | None = None
+    is_admin: bool | None = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str
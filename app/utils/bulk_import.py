@@ -0,0 +1,80 @@
+import codecs
+import csv
+from typing import AsyncIterable, AsyncIterator, List, Tuple
+
+import orjson
+from pydantic import ValidationError
+
+from app.schemas.product import ProductCreate
+
+
+class ImportFormatError(ValueError):
+    """The upload cannot be parsed at all (e.g. missing CSV header)"""
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[List[str]]:
+    """Split a streamed utf-8 body into lines, yielding the complete lines of each chunk"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        if lines:
+            yield lines
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield [pending]
+
+
+async def iter_row_batches(
+    chunks: AsyncIterable[bytes], format: str, batch_size: int
+) -> AsyncIterator[List[Tuple[int, object]]]:
+    """Yield batches of (line number, dict or parse error message); one record per line"""
+    header = None
+    line_no = 0
+    batch = []
+    async for lines in iter_lines(chunks):
+        for line in lines:
+            line_no += 1
+            line = line.rstrip("\r")
+            if not line.strip():
+                continue
+            if format == "csv":
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                if len(values) != len(header):
+                    batch.append((line_no, f"expected {len(header)} fields, got {len(values)}"))
+                else:
+                    batch.append((line_no, dict(zip(header, values))))
+            else:
+                try:
+                    data = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    data = f"invalid JSON: {e}"
+                batch.append((line_no, data if isinstance(data, (dict, str)) else "expected a JSON object"))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if format == "csv" and header is None:
+        raise ImportFormatError("CSV header row is missing")
+    if batch:
+        yield batch
+
+
+def validate_rows(batch: List[Tuple[int, object]]) -> Tuple[list, list]:
+    """Validate parsed rows against ProductCreate; returns (products, per-line errors)"""
+    products, errors = [], []
+    for line_no, data in batch:
+        if isinstance(data, str):
+            errors.append({"line": line_no, "errors": [data]})
+            continue
+        try:
+            products.append(ProductCreate.model_validate(data))
+        except ValidationError as e:
+            errors.append({
+                "line": line_no,
+                "errors": [f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors()],
+            })
+    return products, errors
@@ -0,0 +1,21 @@
+import csv
+import io
+from typing import Iterable, Mapping, Sequence
+
+import orjson
+
+from app.core.responses import json_default
+
+
+def ndjson_chunk(rows: Iterable[Mapping]) -> bytes:
+    """Encode rows as newline-delimited JSON, one object per line"""
+    return b"".join(
+        orjson.dumps(dict(row), default=json_default, option=orjson.OPT_APPEND_NEWLINE) for row in rows
+    )
+
+
+def csv_chunk(rows: Iterable[Sequence]) -> bytes:
+    """Encode rows (or a single header row in a list) as CSV lines"""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode()
@@ -32,4 +32,19 @@ async def db_session():
         yield session
 
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.drop_all)
+
+@pytest.fixture
+async def session_factory():
+    """Session factory for tests that need several concurrent sessions"""
+    engine = create_async_engine(TEST_DATABASE_URL, pool_size=20)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    yield async_session
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
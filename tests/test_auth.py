@@ -1,5 +1,19 @@
+import asyncio
+
 import pytest
 from httpx import AsyncClient
+from jose import JWTError, jwt
+
+from app.core import security
+from app.core.cache import ReadThroughCache
+from app.core.config import settings
+from app.core.dependencies import get_current_admin_user, get_current_user
+from app.core.security import (
+    PasswordHasher, HashingPoolSaturated, Principal, create_access_token, decode_access_token, principal_cache
+)
+from app.crud.user import get_user_by_email, update_user_status
+from app.main import app
+from app.models.user import User
 
 
 @pytest.mark.anyio
@@ -47,4 +61,116 @@ async def test_login_user(client: AsyncClient):
     })
     assert response.status_code == 200
     data = response.json()
-    assert "access_token" in data
\ No newline at end of file
+    assert "access_token" in data
+
+@pytest.mark.anyio
+async def test_password_hasher_rejects_when_saturated():
+    hasher = PasswordHasher(max_workers=1, max_pending=1)
+    first = asyncio.create_task(hasher.hash("Password1!"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HashingPoolSaturated):
+        await hasher.hash("Password1!")
+
+    hashed = await first
+    assert await hasher.verify("Password1!", hashed)
+    stats = hasher.stats()
+    assert stats["rejected"] == 1
+    assert stats["pending"] == 0
+    assert stats["latency_seconds"]["count"] == 2
+
+
+@pytest.mark.anyio
+async def test_metrics_expose_password_hashing_to_admins_only(client: AsyncClient):
+    response = await client.get("/metrics")
+    assert response.status_code == 401
+
+    app.dependency_overrides[get_current_admin_user] = lambda: Principal(id=1, email="admin@example.com", is_admin=True)
+    try:
+        response = await client.get("/metrics")
+    finally:
+        app.dependency_overrides.pop(get_current_admin_user)
+    assert response.status_code == 200
+    assert "queue_depth" in response.json()["password_hashing"]
+
+
+@pytest.mark.anyio
+async def test_current_user_served_from_principal_cache():
+    async def load():
+        return Principal(id=42, email="cached@example.com")
+
+    await principal_cache.get_or_load("cached@example.com", load)
+    token = create_access_token(data={"sub": "cached@example.com"})
+
+    # No session: a cache hit must not touch the database
+    user = await get_current_user(token=token, db=None)
+    assert user.id == 42
+
+    await principal_cache.invalidate()
+
+
+@pytest.mark.anyio
+async def test_status_change_retires_cached_principal_in_every_worker(db_session):
+    db_user = User(full_name="Status", email="status@example.com", phone="+79990000001", hashed_password="x")
+    db_session.add(db_user)
+    await db_session.commit()
+    user_id = db_user.id
+    token = create_access_token(data={"sub": "status@example.com"})
+
+    principal = await get_current_user(token=token, db=db_session)
+    assert principal == Principal(id=user_id, email="status@example.com", full_name="Status", phone="+79990000001")
+
+    # Another worker: its own local LRU over the same shared backend
+    other_worker = ReadThroughCache("principal", principal_cache.backend, 100, 60)
+
+    async def load_in_other_worker():
+        user = await get_user_by_email(db_session, "status@example.com")
+        return Principal(id=user.id, email=user.email, is_active=user.is_active, is_admin=user.is_admin)
+
+    assert (await other_worker.get_or_load("status@example.com", load_in_other_worker)).is_active
+
+    await update_user_status(db_session, user_id, is_active=False)
+
+    assert not (await get_current_user(token=token, db=db_session)).is_active
+    assert not (await other_worker.get_or_load("status@example.com", load_in_other_worker)).is_active
+    await principal_cache.invalidate()
+
+
+@pytest.mark.anyio
+async def test_current_user_from_trusted_claims(monkeypatch):
+    monkeypatch.setattr(settings, "TRUST_TOKEN_CLAIMS", True)
+    token = create_access_token(data={"sub": "claims@example.com", "uid": 7, "is_active": True, "is_admin": True})
+
+    user = await get_current_user(token=token, db=None)
+    assert user.id == 7
+    assert user.is_admin
+
+
+def test_decode_access_token_with_rotated_keys(monkeypatch):
+    monkeypatch.setattr(security, "signing_keys", {"old": "old-secret", "new": "new-secret"})
+    monkeypatch.setattr(settings, "JWT_ACTIVE_KID", "old")
+    old_token = create_access_token(data={"sub": "rotate@example.com"})
+    monkeypatch.setattr(settings, "JWT_ACTIVE_KID", "new")
+    new_token = create_access_token(data={"sub": "rotate@example.com"})
+
+    assert decode_access_token(old_token)["sub"] == "rotate@example.com"
+    assert decode_access_token(new_token)["sub"] == "rotate@example.com"
+
+    # Retiring a key rejects tokens it signed once they leave the cache
+    security.token_cache.clear()
+    monkeypatch.setattr(security, "signing_keys", {"new": "new-secret"})
+    with pytest.raises(JWTError):
+        decode_access_token(old_token)
+
+
+@pytest.mark.benchmark
+def test_decode_access_token_cache_benchmark():
+    token = create_access_token(data={"sub": "bench@example.com"})
+    rounds = 2000
+
+    for _ in range(rounds):
+        uncached = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    for _ in range(rounds):
+        cached = decode_access_token(token)
+
+    assert cached == uncached
@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.cache import InMemoryCacheBackend, ReadThroughCache, TaggedTTLCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_size=10, ttl=60)
+    cache.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_tagged_cache_invalidates_only_tagged_entries():
+    cache = TaggedTTLCache(max_size=2, ttl=60)
+    cache.set("user:1", "summary 1", tags=[10, 11])
+    cache.set("user:2", "summary 2", tags=[11])
+
+    assert cache.invalidate_tag(10) == 1
+    assert cache.get("user:1") is None
+    assert cache.get("user:2") == "summary 2"
+
+    # Re-tagging replaces old tags, and evicted keys leave the reverse index
+    cache.set("user:2", "summary 2b", tags=[12])
+    assert cache.invalidate_tag(11) == 0
+    cache.set("user:3", "summary 3", tags=[12])
+    cache.set("user:4", "summary 4", tags=[12])
+    assert cache.invalidate_tag(12) == 2
+    assert len(cache) == 0
+
+
+@pytest.mark.anyio
+async def test_read_through_cache_loads_cold_key_once():
+    cache = ReadThroughCache("test", InMemoryCacheBackend(), max_size=10, ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["product"]
+
+    results = await asyncio.gather(*(cache.get_or_load("page", loader) for _ in range(20)))
+
+    assert calls == 1
+    assert all(result == ["product"] for result in results)
+
+
+@pytest.mark.anyio
+async def test_read_through_cache_invalidate_shared_across_workers():
+    backend = InMemoryCacheBackend()
+    worker_a = ReadThroughCache("test", backend, max_size=10, ttl=60)
+    worker_b = ReadThroughCache("test", backend, max_size=10, ttl=60)
+
+    async def old():
+        return "old"
+
+    async def new():
+        return "new"
+
+    assert await worker_a.get_or_load("page", old) == "old"
+    assert await worker_b.get_or_load("page", new) == "old"
+
+    await worker_a.invalidate()
+    assert await worker_b.get_or_load("page", new) == "new"
@@ -1,5 +1,24 @@
+import asyncio
+from decimal import Decimal
+
 import pytest
 from httpx import AsyncClient
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select, text, update
+
+from app.core.database import replica_router
+from app.crud.cart import (
+    CartFanout, OutOfStockError, _CART_UPSERT, _collapse_operations, add_to_cart, apply_cart_batch, cart_fanout, cart_summary_cache,
+    clear_cart, get_cart_items, get_cart_summary, note_cart_write, remove_from_cart,
+)
+from app.crud.order import EmptyCartError, checkout
+from app.crud.product import get_product, update_product
+from app.models.cart import Cart, CartFanoutPending, CartSummary
+from app.models.order import Order, OrderItem
+from app.models.product import Product
+from app.models.user import User
+from app.schemas.cart import CartBatchOperation, CartItemCreate, CartTotal
+from app.schemas.product import ProductUpdate
 
 @pytest.mark.anyio
 async def test_add_to_cart_unauthorized(client: AsyncClient):
@@ -12,4 +31,368 @@ async def test_add_to_cart_unauthorized(client: AsyncClient):
 @pytest.mark.anyio
 async def test_get_cart_unauthorized(client: AsyncClient):
     response = await client.get("/cart/items")
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+@pytest.mark.anyio
+async def test_concurrent_add_to_cart_loses_no_increments(session_factory):
+    async with session_factory() as session:
+        user = User(full_name="Cart User", email="cart@example.com", phone="+71234567899", hashed_password="x")
+        product = Product(name="Concurrent Product", price=10, stock=100)
+        session.add_all([user, product])
+        await session.commit()
+        user_id, product_id = user.id, product.id
+
+    async def add_one():
+        async with session_factory() as session:
+            await add_to_cart(session, user_id, product_id, 1)
+
+    await asyncio.gather(*(add_one() for _ in range(50)))
+
+    async with session_factory() as session:
+        items = await get_cart_items(session, user_id)
+    assert len(items) == 1
+    assert items[0].quantity == 50
+
+def test_note_cart_write_pins_user_and_drops_cached_summary():
+    user_id = 987654
+    cart_summary_cache.set(user_id, CartTotal(total=Decimal("5.00"), item_count=1, version=1), tags=[1])
+
+    note_cart_write(user_id)
+
+    assert replica_router.is_sticky(user_id)
+    assert cart_summary_cache.get(user_id) is None
+
+def test_collapse_batch_operations():
+    operations = [
+        CartBatchOperation(op="add", product_id=1, quantity=2),
+        CartBatchOperation(op="add", product_id=1, quantity=3),
+        CartBatchOperation(op="set", product_id=2, quantity=4),
+        CartBatchOperation(op="add", product_id=2, quantity=1),
+        CartBatchOperation(op="remove", product_id=3),
+        CartBatchOperation(op="add", product_id=3, quantity=2),
+        CartBatchOperation(op="set", product_id=4, quantity=0),
+    ]
+    assert _collapse_operations(operations) == {
+        1: ("add", 5),
+        2: ("set", 5),
+        3: ("set", 2),
+        4: ("remove", 0),
+    }
+
+@pytest.mark.anyio
+async def test_cart_batch_unauthorized(client: AsyncClient):
+    response = await client.post("/cart/batch", json={
+        "operations": [{"op": "add", "product_id": 1, "quantity": 2}]
+    })
+    assert response.status_code == 401
+
+@pytest.mark.benchmark
+@pytest.mark.anyio
+async def test_clear_cart_benchmark(session_factory):
+    async with session_factory() as session:
+        user = User(full_name="Bench User", email="bench@example.com", phone="+71234567898", hashed_password="x")
+        session.add(user)
+        await session.execute(insert(Product), [{"name": f"Product {i}", "price": 1} for i in range(1000)])
+        await session.commit()
+        product_ids = (await session.execute(select(Product.id).order_by(Product.id))).scalars().all()
+
+        for lines in (10, 100, 1000):
+            await session.execute(insert(Cart), [
+                {"user_id": user.id, "product_id": product_id, "quantity": 1}
+                for product_id in product_ids[:lines]
+            ])
+            await session.commit()
+
+            removed = await clear_cart(session, user.id)
+            assert removed == lines
+
+@pytest.mark.anyio
+async def test_get_cart_view_unauthorized(client: AsyncClient):
+    response = await client.get("/cart")
+    assert response.status_code == 401
+
+@pytest.mark.anyio
+async def test_checkout_unauthorized(client: AsyncClient):
+    response = await client.post("/cart/checkout", headers={"Idempotency-Key": "abc"})
+    assert response.status_code == 401
+
+@pytest.mark.benchmark
+@pytest.mark.anyio
+async def test_concurrent_checkout_load(session_factory):
+    users_count = 200
+    async with session_factory() as session:
+        await session.execute(insert(Product), [{"name": f"Product {i}", "price": i + 1, "stock": 1000} for i in range(5)])
+        await session.execute(insert(User), [
+            {"full_name": f"Buyer {i}", "email": f"buyer{i}@example.com", "phone": f"+7900{i:07d}", "hashed_password": "x"}
+            for i in range(users_count)
+        ])
+        product_ids = (await session.execute(select(Product.id).order_by(Product.id))).scalars().all()
+        user_ids = (await session.execute(select(User.id))).scalars().all()
+        await session.execute(insert(Cart), [
+            {"user_id": user_id, "product_id": product_id, "quantity": 2}
+            for user_id in user_ids for product_id in product_ids
+        ])
+        await session.commit()
+
+    async def place(user_id):
+        async with session_factory() as session:
+            return await checkout(session, user_id, idempotency_key=f"checkout-{user_id}")
+
+    # Every checkout is sent twice at once, like a client retrying on timeout
+    results = await asyncio.gather(*(place(user_id) for user_id in user_ids for _ in range(2)))
+
+    for first, second in zip(results[::2], results[1::2]):
+        assert first[0] == second[0]
+        assert sorted([first[1], second[1]]) == [False, True]
+        assert first[0].total == 2 * (1 + 2 + 3 + 4 + 5)
+        assert len(first[0].items) == 5
+
+    async with session_factory() as session:
+        assert (await session.execute(select(func.count()).select_from(Cart))).scalar_one() == 0
+        assert (await session.execute(select(func.count()).select_from(Order))).scalar_one() == users_count
+        # Without a key the now empty cart is refused
+        with pytest.raises(EmptyCartError):
+            await checkout(session, user_ids[0])
+
+@pytest.mark.anyio
+async def test_non_positive_quantities_never_reach_an_order(session_factory):
+    with pytest.raises(ValidationError):
+        CartItemCreate(product_id=1, quantity=-4)
+    with pytest.raises(ValidationError):
+        CartItemCreate(product_id=1, quantity=0)
+
+    async with session_factory() as session:
+        user = User(full_name="Negative User", email="negative@example.com", phone="+71234567894", hashed_password="x")
+        kettle = Product(name="Kettle", price=Decimal("3.00"), stock=10)
+        session.add_all([user, kettle])
+        await session.commit()
+        user_id, kettle_id = user.id, kettle.id
+
+        # The statement itself refuses a negative quantity, whatever the caller validated
+        with pytest.raises(OutOfStockError):
+            await add_to_cart(session, user_id, kettle_id, -4)
+        # A negative line written behind the API's back is never ordered
+        await session.execute(insert(Cart).values(user_id=user_id, product_id=kettle_id, quantity=-4))
+        await session.commit()
+        with pytest.raises(EmptyCartError):
+            await checkout(session, user_id)
+        assert (await session.execute(select(Product.stock).filter(Product.id == kettle_id))).scalar_one() == 10
+
+@pytest.mark.anyio
+async def test_cart_batch_checks_stock_like_add(session_factory):
+    async with session_factory() as session:
+        user = User(full_name="Batch Stock", email="batch-stock@example.com", phone="+71234567893", hashed_password="x")
+        tea = Product(name="Tea", price=Decimal("4.00"), stock=10)
+        session.add_all([user, tea])
+        await session.commit()
+        user_id, tea_id = user.id, tea.id
+
+        with pytest.raises(OutOfStockError) as error:
+            await apply_cart_batch(session, user_id, [CartBatchOperation(op="set", product_id=tea_id, quantity=500)])
+        assert error.value.product_ids == [tea_id]
+
+        await apply_cart_batch(session, user_id, [CartBatchOperation(op="add", product_id=tea_id, quantity=6)])
+        # 6 already in the cart plus 5 more is over the stock of 10, so nothing changes
+        with pytest.raises(OutOfStockError):
+            await apply_cart_batch(session, user_id, [CartBatchOperation(op="add", product_id=tea_id, quantity=5)])
+        assert [item.quantity for item in await get_cart_items(session, user_id)] == [6]
+
+@pytest.mark.benchmark
+@pytest.mark.anyio
+async def test_hot_sku_checkout_never_oversells(session_factory):
+    buyers, stock = 1000, 300
+    async with session_factory() as session:
+        product = Product(name="Hot SKU", price=10, stock=stock)
+        session.add(product)
+        await session.execute(insert(User), [
+            {"full_name": f"Hot Buyer {i}", "email": f"hot{i}@example.com", "phone": f"+7911{i:07d}", "hashed_password": "x"}
+            for i in range(buyers)
+        ])
+        await session.commit()
+        user_ids = (await session.execute(select(User.id))).scalars().all()
+        await session.execute(insert(Cart), [
+            {"user_id": user_id, "product_id": product.id, "quantity": 1} for user_id in user_ids
+        ])
+        await session.commit()
+        product_id = product.id
+
+    async def buy(user_id):
+        async with session_factory() as session:
+            try:
+                await checkout(session, user_id)
+                return True
+            except OutOfStockError:
+                return False
+
+    results = await asyncio.gather(*(buy(user_id) for user_id in user_ids))
+    assert sum(results) == stock
+    async with session_factory() as session:
+        assert (await session.execute(select(Product.stock).filter(Product.id == product_id))).scalar_one() == 0
+        assert (await session.execute(select(func.sum(OrderItem.quantity)))).scalar_one() == stock
+        with pytest.raises(OutOfStockError):
+            await add_to_cart(session, user_ids[0], product_id, 1)
+
+@pytest.mark.anyio
+async def test_checkout_refreshes_cached_stock(session_factory):
+    async with session_factory() as session:
+        product = Product(name="Cached SKU", price=10, stock=5)
+        user = User(full_name="Cache Buyer", email="cachebuyer@example.com", phone="+71234567801", hashed_password="x")
+        session.add_all([product, user])
+        await session.commit()
+        product_id, user_id = product.id, user.id
+
+    async with session_factory() as session:
+        assert (await get_product(session, product_id)).stock == 5
+        await add_to_cart(session, user_id, product_id, 2)
+        await checkout(session, user_id)
+
+    async with session_factory() as session:
+        assert (await get_product(session, product_id)).stock == 3
+
+@pytest.mark.anyio
+async def test_cart_summary_tracks_every_mutation(session_factory):
+    async with session_factory() as session:
+        user = User(full_name="Summary User", email="summary@example.com", phone="+71234567897", hashed_password="x")
+        phone = Product(name="Phone", price=Decimal("100.00"), stock=10)
+        cable = Product(name="Cable", price=Decimal("2.50"), stock=10)
+        session.add_all([user, phone, cable])
+        await session.commit()
+
+        async def expected():
+            result = await session.execute(
+                select(func.coalesce(func.sum(Product.price * Cart.quantity), 0), func.coalesce(func.sum(Cart.quantity), 0))
+                .join(Product, Product.id == Cart.product_id)
+                .filter(Cart.user_id == user.id, Product.is_active == True)
+            )
+            return tuple(result.one())
+
+        versions = []
+        async def check():
+            summary = await get_cart_summary(session, user.id)
+            assert (summary.total, summary.item_count) == await expected()
+            versions.append(summary.version)
+
+        await add_to_cart(session, user.id, phone.id, 2)
+        await check()
+        await add_to_cart(session, user.id, cable.id, 4)
+        await check()
+        await remove_from_cart(session, user.id, phone.id)
+        await check()
+        await apply_cart_batch(session, user.id, [
+            CartBatchOperation(op="set", product_id=cable.id, quantity=1),
+            CartBatchOperation(op="add", product_id=phone.id, quantity=3),
+        ])
+        await check()
+        await update_product(session, phone.id, ProductUpdate(name="Phone", price=Decimal("90.00")))
+        await check()
+        await update_product(session, cable.id, ProductUpdate(name="Cable", price=Decimal("2.50"), is_active=False))
+        await check()
+        await clear_cart(session, user.id)
+        await check()
+
+        assert versions == sorted(set(versions))
+
+@pytest.mark.benchmark
+@pytest.mark.anyio
+async def test_price_change_fanout_touches_only_affected_carts(session_factory):
+    users_count, popular_holders = 20_000, 5_000
+    async with session_factory() as session:
+        popular = Product(name="Popular", price=Decimal("10.00"), stock=1_000_000)
+        niche = Product(name="Niche", price=Decimal("1.00"), stock=1_000_000)
+        session.add_all([popular, niche])
+        await session.commit()
+        await session.execute(text(
+            "INSERT INTO users (full_name, email, phone, hashed_password) "
+            "SELECT 'Fanout ' || g, 'fanout' || g || '@example.com', '+7922' || lpad(g::text, 7, '0'), 'x' "
+            "FROM generate_series(1, :n) AS g"
+        ), {"n": users_count})
+        await session.execute(text(
+            "INSERT INTO carts (user_id, product_id, quantity) "
+            "SELECT id, CAST(:niche AS integer), 1 FROM users "
+            "UNION ALL SELECT id, CAST(:popular AS integer), 2 FROM users WHERE id % :step = 0"
+        ), {"niche": niche.id, "popular": popular.id, "step": users_count // popular_holders})
+        await session.execute(text(
+            "INSERT INTO cart_summaries (user_id, item_count, total, version) "
+            "SELECT carts.user_id, sum(carts.quantity), sum(products.price * carts.quantity), 1 "
+            "FROM carts JOIN products ON products.id = carts.product_id GROUP BY carts.user_id"
+        ))
+        await session.commit()
+
+        await update_product(session, popular.id, ProductUpdate(name="Popular", price=Decimal("12.00")))
+
+        versions = dict((await session.execute(
+            select(CartSummary.version, func.count()).group_by(CartSummary.version)
+        )).all())
+        assert versions == {1: users_count - popular_holders, 2: popular_holders}
+        stale = (await session.execute(
+            select(func.count()).select_from(CartSummary)
+            .filter(CartSummary.version == 2, CartSummary.total != Decimal("25.00"))
+        )).scalar_one()
+        assert stale == 0
+
+@pytest.mark.anyio
+async def test_cart_fanout_recovers_retries_and_drains_on_stop(session_factory, monkeypatch):
+    async with session_factory() as session:
+        user = User(full_name="Fanout Worker", email="fanout-worker@example.com", phone="+71234567896", hashed_password="x")
+        lamp = Product(name="Lamp", price=Decimal("10.00"), stock=10)
+        session.add_all([user, lamp])
+        await session.commit()
+        user_id, lamp_id = user.id, lamp.id
+        await add_to_cart(session, user_id, lamp_id, 2)
+        # A price change whose process died before the fanout ran
+        await session.execute(update(Product).filter(Product.id == lamp_id).values(price=Decimal("15.00")))
+        await cart_fanout.mark_pending(session, lamp_id)
+        await session.commit()
+
+    opened = []
+    def flaky_sessions():
+        opened.append(True)
+        if len(opened) == 1:
+            raise ConnectionError("database is restarting")
+        return session_factory()
+    monkeypatch.setattr("app.crud.cart.AsyncSessionLocal", flaky_sessions)
+
+    fanout = CartFanout(chunk_size=100, batch_seconds=0.01, max_retry_seconds=0.05)
+    fanout.start()
+    for _ in range(100):
+        if fanout.batches:
+            break
+        await asyncio.sleep(0.01)
+    assert fanout.failures == 1
+
+    async with session_factory() as session:
+        assert (await session.get(CartSummary, user_id)).total == Decimal("30.00")
+
+        await session.execute(update(Product).filter(Product.id == lamp_id).values(price=Decimal("20.00")))
+        await fanout.mark_pending(session, lamp_id)
+        await session.commit()
+        await fanout.notify(session, lamp_id)
+        # Queued but not yet refreshed: stop() finishes it inline
+        await fanout.stop()
+
+        session.expire_all()
+        assert (await session.get(CartSummary, user_id)).total == Decimal("40.00")
+        assert (await session.execute(select(func.count()).select_from(CartFanoutPending))).scalar_one() == 0
+
+@pytest.mark.anyio
+async def test_price_change_waits_for_in_flight_cart_write(session_factory):
+    async with session_factory() as session:
+        user = User(full_name="Race User", email="race@example.com", phone="+71234567895", hashed_password="x")
+        mug = Product(name="Mug", price=Decimal("10.00"), stock=10)
+        session.add_all([user, mug])
+        await session.commit()
+        user_id, mug_id = user.id, mug.id
+
+    async with session_factory() as writer, session_factory() as admin:
+        # The cart write has read the product but not committed yet
+        await writer.execute(_CART_UPSERT, {"user_id": user_id, "product_id": mug_id, "quantity": 3})
+        repricing = asyncio.create_task(
+            update_product(admin, mug_id, ProductUpdate(name="Mug", price=Decimal("12.00")))
+        )
+        await asyncio.sleep(0.2)
+        assert not repricing.done()
+        await writer.commit()
+        await repricing
+
+    async with session_factory() as session:
+        assert (await session.get(CartSummary, user_id)).total == Decimal("36.00")
@@ -1,5 +1,29 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
 import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from httpx import AsyncClient
+from sqlalchemy import func, select, text, update
+
+from app.core.responses import FastJSONResponse
+from app.api.products import _decode_position
+from app.crud.cart import ProductUnavailableError, add_to_cart, apply_cart_batch
+from app.crud.product import (
+    ProductArchiver, archive_inactive_products, copy_products, delete_product, get_products, search_cache, search_products
+)
+from app.models.cart import Cart, CartSummary
+from app.models.product import Product as ProductModel, ProductArchive
+from app.models.user import User
+from app.schemas.cart import CartBatchOperation, CartTotal
+from app.schemas.product import Product as ProductSchema, ProductList
+
+from app.utils.bulk_import import ImportFormatError, iter_row_batches, validate_rows
+from app.utils.export import csv_chunk, ndjson_chunk
+from app.utils.pagination import decode_cursor, encode_cursor, etag_matches, weak_etag
 
 @pytest.mark.anyio
 async def test_get_products_unauthorized(client: AsyncClient):
@@ -12,4 +36,247 @@ async def test_create_product_unauthorized(client: AsyncClient):
         "name": "Test Product",
         "price": "99.99"
     })
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"id": 1234})
+    assert decode_cursor(cursor) == {"id": 1234}
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_weak_etag_matching():
+    etag = weak_etag([(1, "Phone", "99.99")])
+    assert etag.startswith('W/"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag.removeprefix("W/")}', etag)
+    assert not etag_matches(weak_etag([(1, "Phone", "89.99")]), etag)
+
+@pytest.mark.benchmark
+def test_product_list_fast_path_benchmark():
+    rows = [
+        {"id": i, "name": f"Product {i}", "price": Decimal("9.99"), "is_active": True, "stock": 5,
+         "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc), "updated_at": None}
+        for i in range(10_000)
+    ]
+
+    orm_objects = [ProductModel(**row) for row in rows]
+    orm_body = json.dumps(jsonable_encoder([ProductSchema.model_validate(p) for p in orm_objects]))
+    fast_body = ProductList.dump_json(ProductList.validate_python(rows))
+
+    assert json.loads(fast_body) == json.loads(orm_body)
+
+def test_fast_json_response_matches_default_encoder():
+    product = ProductSchema(
+        id=1, name="Phone", price=Decimal("1999.90"), is_active=True, stock=3,
+        created_at=datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc), updated_at=None,
+    )
+    product_json = (
+        b'{"name":"Phone","price":"1999.90","id":1,"is_active":true,"stock":3,'
+        b'"created_at":"2024-05-01T12:30:00Z","updated_at":null}'
+    )
+    cart_total = CartTotal(total=Decimal("0.10"), item_count=1, version=3)
+    cart_total_json = b'{"total":"0.10","item_count":1,"version":3}'
+
+    for model, expected in ((product, product_json), (cart_total, cart_total_json)):
+        assert FastJSONResponse(model.model_dump(mode="json")).body == expected
+        assert JSONResponse(jsonable_encoder(model)).body == expected
+
+    assert ProductList.dump_json([product]) == b"[" + product_json + b"]"
+    # Raw Decimals are kept exact instead of being turned into floats
+    assert FastJSONResponse({"total": Decimal("10.10")}).body == b'{"total":"10.10"}'
+
+@pytest.mark.anyio
+async def test_export_products_unauthorized(client: AsyncClient):
+    response = await client.get("/products/export?format=csv")
+    assert response.status_code == 401
+
+def test_export_chunk_encoders():
+    row = {"id": 7, "name": 'Cable, "USB-C"', "price": Decimal("4.50"), "is_active": False,
+           "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc), "updated_at": None}
+
+    line = ndjson_chunk([row, row]).split(b"\n")
+    assert line[2] == b""
+    assert json.loads(line[0]) == {**row, "price": "4.50", "created_at": "2024-01-01T00:00:00+00:00"}
+
+    csv_text = csv_chunk([("id", "name", "price"), (7, row["name"], row["price"])]).decode()
+    assert csv_text == 'id,name,price\n7,"Cable, ""USB-C""",4.50\n'
+
+async def _chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+@pytest.mark.anyio
+async def test_import_rows_are_parsed_and_validated_per_line():
+    body = 'name,price,stock\nЧайник,"1,5",1\nCable,4.50,3\n\nBroken,1,2,9\nLamp,12,0\n'.encode()
+    # Tiny chunks split lines and multi-byte characters across reads
+    batches = [batch async for batch in iter_row_batches(_chunked(body, 3), "csv", batch_size=2)]
+    rows = [row for batch in batches for row in batch]
+    assert [len(batch) for batch in batches] == [2, 2]
+
+    products, errors = validate_rows(rows)
+    assert [(p.name, p.price) for p in products] == [("Cable", Decimal("4.50")), ("Lamp", Decimal("12"))]
+    assert [e["line"] for e in errors] == [2, 5]
+
+    # Values the price and stock columns cannot hold are row errors, not a failed COPY
+    products, errors = validate_rows([
+        (1, {"name": "C", "price": "99999999999", "stock": "1"}),
+        (2, {"name": "D", "price": "1.005", "stock": "1"}),
+        (3, {"name": "E", "price": "1", "stock": "99999999999"}),
+        (4, {"name": "F", "price": "99999999.99", "stock": "0"}),
+        (5, {"name": "G", "price": "1"}),
+    ])
+    assert [p.name for p in products] == ["F"]
+    assert [e["line"] for e in errors] == [1, 2, 3, 5]
+    assert errors[-1]["errors"] == ["stock: Field required"]
+
+    ndjson = b'{"name": "Phone", "price": "99.99", "stock": 1}\n[1]\n{"name": "x"'
+    rows = [row async for batch in iter_row_batches(_chunked(ndjson, 7), "ndjson", 100) for row in batch]
+    products, errors = validate_rows(rows)
+    assert [p.name for p in products] == ["Phone"]
+    assert [e["line"] for e in errors] == [2, 3]
+
+    with pytest.raises(ImportFormatError):
+        [batch async for batch in iter_row_batches(_chunked(b"", 1), "csv", 100)]
+
+@pytest.mark.anyio
+async def test_import_products_unauthorized(client: AsyncClient):
+    response = await client.post("/products/import?format=csv", content=b"name,price\nPhone,1\n")
+    assert response.status_code == 401
+
+@pytest.mark.benchmark
+@pytest.mark.anyio
+async def test_copy_import_benchmark(session_factory):
+    rows = 100_000
+    body = b"".join(f'{{"name": "Product {i}", "price": "{i % 1000}.99", "stock": 10}}\n'.encode() for i in range(rows))
+
+    async with session_factory() as session:
+        imported = 0
+        async for batch in iter_row_batches(_chunked(body, 64 * 1024), "ndjson", 5000):
+            products, errors = validate_rows(batch)
+            assert not errors
+            imported += await copy_products(session, products)
+        await session.commit()
+
+        count = (await session.execute(select(func.count()).select_from(ProductModel))).scalar_one()
+        assert imported == count == rows
+
+@pytest.mark.anyio
+async def test_search_products_unauthorized(client: AsyncClient):
+    response = await client.get("/products/search?q=phone")
+    assert response.status_code == 401
+
+@pytest.mark.anyio
+async def test_search_pages_through_matches_with_or_without_pg_trgm(session_factory):
+    async with session_factory() as session:
+        session.add_all([
+            ProductModel(name=name, price=1, stock=1) for name in ("Phone X", "Smartphone", "Cable", "Old phone")
+        ])
+        await session.commit()
+        await session.execute(update(ProductModel).where(ProductModel.name == "Old phone").values(is_active=False))
+        await session.commit()
+
+        search_cache.clear()
+        first, position = await search_products(session, "PHONE", limit=1)
+        second, last = await search_products(session, "phone", limit=1, after=position)
+        assert last is not None
+        assert await search_products(session, "phone", limit=1, after=last) == ([], None)
+        assert sorted(p.name for p in first + second) == ["Phone X", "Smartphone"]
+
+@pytest.mark.benchmark
+@pytest.mark.anyio
+async def test_search_benchmark_1m_products(session_factory):
+    async with session_factory() as session:
+        await session.execute(text(
+            "INSERT INTO products (name, price, is_active) "
+            "SELECT 'Product ' || g || ' ' || md5(g::text), (g % 1000) + 0.99, true "
+            "FROM generate_series(1, 1000000) AS g"
+        ))
+        await session.commit()
+        await session.execute(text("ANALYZE products"))
+
+        for q in ("product 4242", "a1b2", "ffff", "beef"):
+            search_cache.clear()
+            products, next_position = await search_products(session, q, limit=20)
+            assert all(q in p.name.lower() for p in products)
+
+            if next_position is not None:
+                next_page, _ = await search_products(session, q, limit=20, after=next_position)
+                assert not {p.id for p in products} & {p.id for p in next_page}
+
+        # A prefix with no matches answers longer queries from the cache
+        assert await search_products(session, "zzzz") == ([], None)
+        hits = search_cache.hits
+        assert await search_products(session, "zzzzy") == ([], None)
+        assert search_cache.hits == hits + 1
+
+def test_sorted_listing_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 0, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor({"s": "-created_at", "v": created_at, "id": 42})
+    assert _decode_position(cursor, "-created_at") == (created_at, 42)
+
+    cursor = encode_cursor({"s": "price", "v": Decimal("9.90"), "id": 7})
+    assert _decode_position(cursor, "price") == (Decimal("9.90"), 7)
+    # Cursors only continue the ordering they were issued for; legacy id-only cursors mean sort=id
+    with pytest.raises(ValueError):
+        _decode_position(cursor, "name")
+    assert _decode_position(encode_cursor({"id": 3}), "id") == (None, 3)
+
+@pytest.mark.anyio
+async def test_soft_delete_and_archival(session_factory):
+    async with session_factory() as session:
+        user = User(full_name="Archive User", email="archive@example.com", phone="+71234567896", hashed_password="x")
+        kept = ProductModel(name="Kept", price=1, stock=5)
+        retired = ProductModel(name="Retired", price=2, stock=5)
+        session.add_all([user, kept, retired])
+        await session.commit()
+        await add_to_cart(session, user.id, retired.id, 1)
+
+        # Referenced by a cart, yet deleting no longer fails on the FK
+        assert (await delete_product(session, retired.id)).is_active is False
+        page = await get_products(session, limit=10)
+        assert [p.id for p in page] == [kept.id]
+        # The fanout dropped the soft-deleted line from the persisted summary
+        summary = await session.get(CartSummary, user.id, populate_existing=True)
+        assert (summary.item_count, summary.total) == (0, 0)
+
+        # Inactive products cannot come back into carts, so the archiver never races a late line
+        user_id, retired_id = user.id, retired.id
+        with pytest.raises(ProductUnavailableError):
+            await apply_cart_batch(session, user_id, [CartBatchOperation(op="add", product_id=retired_id, quantity=1)])
+
+        # Recently deactivated products stay put
+        assert await archive_inactive_products(session, after_days=30) == 0
+        await session.execute(
+            update(ProductModel).where(ProductModel.id == retired_id)
+            .values(updated_at=datetime.now(timezone.utc) - timedelta(days=31))
+        )
+        await session.commit()
+
+        assert await archive_inactive_products(session, after_days=30, batch_size=1) == 1
+        archived = (await session.execute(select(ProductArchive.id, ProductArchive.name))).all()
+        assert [tuple(row) for row in archived] == [(retired_id, "Retired")]
+        assert (await session.execute(select(func.count()).select_from(ProductModel))).scalar_one() == 1
+        assert (await session.execute(select(func.count()).select_from(Cart))).scalar_one() == 0
+
+
+@pytest.mark.anyio
+async def test_archiver_retries_failed_run_without_waiting_an_interval(session_factory, monkeypatch):
+    opened = []
+    def flaky_sessions():
+        opened.append(True)
+        if len(opened) == 1:
+            raise ConnectionError("database is restarting")
+        return session_factory()
+    monkeypatch.setattr("app.crud.product.AsyncSessionLocal", flaky_sessions)
+
+    archiver = ProductArchiver(after_days=30, batch_size=100, interval=3600, retry_seconds=0.01)
+    archiver.start()
+    for _ in range(100):
+        if archiver.runs:
+            break
+        await asyncio.sleep(0.01)
+    await archiver.stop()
+
+    assert (archiver.failures, archiver.runs) == (1, 1)
@@ -1,11 +1,14 @@
 # tests/test_database.py
 import pytest
 import asyncio
+from datetime import datetime, timezone
+from decimal import Decimal
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine
 from app.core.config import settings
 
 
-@pytest.mark.asyncio
+@pytest.mark.anyio
 async def test_database_connection():
     """Тест подключения к базе данных"""
     try:
@@ -24,7 +27,7 @@ async def test_database_connection():
         pytest.fail(f"Не удалось подключиться к базе данных: {e}")
 
 
-@pytest.mark.asyncio
+@pytest.mark.anyio
 async def test_database_creation():
     """Тест создания таблиц"""
     from app.core.database import create_db_and_tables
@@ -32,4 +35,179 @@ async def test_database_creation():
         await create_db_and_tables()
         assert True
     except Exception as e:
-        pytest.fail(f"Ошибка создания таблиц: {e}")
\ No newline at end of file
+        pytest.fail(f"Ошибка создания таблиц: {e}")
+
+HOT_QUERIES = {
+    "cart items": "SELECT * FROM carts WHERE user_id = 1",
+    "cart total": (
+        "SELECT sum(products.price * carts.quantity) FROM carts "
+        "JOIN products ON products.id = carts.product_id WHERE carts.user_id = 1"
+    ),
+    "clear cart": "DELETE FROM carts WHERE user_id = 1",
+    "cart summary": "SELECT * FROM cart_summaries WHERE user_id = 1",
+    "cart line": "SELECT * FROM carts WHERE user_id = 1 AND product_id = 1",
+    "carts by product": "SELECT DISTINCT user_id FROM carts WHERE product_id = 1 AND user_id > 100 ORDER BY user_id LIMIT 500",
+    "active products page": "SELECT * FROM products WHERE is_active = true AND id > 100 ORDER BY id LIMIT 100",
+    "archival scan": "SELECT id FROM products WHERE is_active = false ORDER BY id LIMIT 1000",
+}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name", HOT_QUERIES)
+async def test_hot_queries_use_indexes(db_session, name):
+    """Тест: горячие запросы корзины и каталога используют индексы"""
+    # On empty tables the planner always prefers a seq scan; forbid it to see if an index can serve the query
+    await db_session.execute(text("SET enable_seqscan = off"))
+    result = await db_session.execute(text(f"EXPLAIN {HOT_QUERIES[name]}"))
+    plan = "\n".join(row[0] for row in result)
+
+    assert "Seq Scan" not in plan, plan
+    assert "Index" in plan, plan
+
+
+@pytest.mark.anyio
+async def test_product_search_uses_trigram_index(db_session):
+    """Тест: поиск по названию использует trigram-индекс из миграции 0003 (если есть pg_trgm)"""
+    available = (await db_session.execute(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    )).scalar()
+    if not available:
+        pytest.skip("pg_trgm is not available on this server")
+    await db_session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    await db_session.execute(text(
+        "CREATE INDEX ix_products_name_trgm ON products USING gin (name gin_trgm_ops) WHERE is_active = true"
+    ))
+    await db_session.execute(text("SET enable_seqscan = off"))
+    result = await db_session.execute(
+        text("EXPLAIN SELECT id FROM products WHERE is_active = true AND name ILIKE '%phone%'")
+    )
+    plan = "\n".join(row[0] for row in result)
+
+    assert "ix_products_name_trgm" in plan, plan
+
+
+PRODUCT_LISTINGS = {
+    "by id": dict(),
+    "by price": dict(sort="price", after=(Decimal("10.00"), 5)),
+    "by price desc": dict(sort="-price", after=(Decimal("10.00"), 5)),
+    "price range": dict(sort="price", min_price=Decimal("5"), max_price=Decimal("50")),
+    "new arrivals": dict(sort="-created_at", created_after=datetime(2024, 1, 1, tzinfo=timezone.utc)),
+    "by name": dict(sort="name", after=("Phone", 5)),
+}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name", PRODUCT_LISTINGS)
+async def test_product_listings_use_indexes(db_session, name):
+    """Тест: фильтры и сортировки каталога обслуживаются индексами"""
+    from sqlalchemy.dialects import postgresql
+    from app.crud.product import products_query
+
+    query = products_query(**PRODUCT_LISTINGS[name]).limit(100)
+    sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    await db_session.execute(text("SET enable_seqscan = off"))
+    result = await db_session.execute(text(f"EXPLAIN {sql}"))
+    plan = "\n".join(row[0] for row in result)
+
+    assert "Seq Scan" not in plan, plan
+    assert "Index" in plan, plan
+
+
+def test_pool_configured_from_settings():
+    """Тест: параметры пула берутся из настроек и видны в метриках"""
+    from app.core.database import engine, pool_stats
+
+    assert not engine.echo
+    assert engine.pool.size() == settings.DB_POOL_SIZE
+    stats = pool_stats()
+    assert stats["checked_out"] == 0
+    assert "wait_seconds" in stats
+
+
+@pytest.mark.anyio
+async def test_lazy_session_releases_connection_after_read_phase(db_session):
+    """Тест: ленивая сессия держит одно соединение на все чтения и отдаёт его по release()"""
+    from app.core.database import LazyReleaseSession
+
+    engine = db_session.bind
+    async with LazyReleaseSession(engine) as session:
+        assert engine.pool.checkedout() == 0
+        result = await session.execute(text("SELECT pg_backend_pid()"))
+        backend = result.scalar()
+        assert engine.pool.checkedout() == 1
+        assert (await session.scalars(text("SELECT pg_backend_pid()"))).one() == backend
+        assert await session.scalar(text("SELECT pg_backend_pid()")) == backend
+        await session.release()
+        assert engine.pool.checkedout() == 0
+
+
+def test_replica_router_round_robin_ejection_and_stickiness():
+    """Тест: балансировка чтения по репликам, исключение сбойных и read-your-writes"""
+    from app.core.database import ReplicaRouter
+
+    replica_a, replica_b = object(), object()
+    router = ReplicaRouter([replica_a, replica_b], eject_seconds=60, sticky_seconds=60)
+
+    assert [router.pick() for _ in range(4)] == [replica_a, replica_b, replica_a, replica_b]
+
+    router.eject(replica_a)
+    assert [router.pick() for _ in range(3)] == [replica_b, replica_b, replica_b]
+    router.eject(replica_b)
+    assert router.pick() is None
+
+    assert not router.is_sticky(1)
+    router.stick_to_primary(1)
+    assert router.is_sticky(1)
+
+
+def test_replica_router_forgets_expired_sticky_users(monkeypatch):
+    """Тест: истёкшие закрепления за primary удаляются при новых записях"""
+    from app.core import database
+
+    clock = [1000.0]
+    monkeypatch.setattr(database.time, "monotonic", lambda: clock[0])
+    router = database.ReplicaRouter([], eject_seconds=60, sticky_seconds=5)
+
+    for user_id in range(1000):
+        router.stick_to_primary(user_id)
+    clock[0] += 10
+    router.stick_to_primary(1000)
+    router.stick_to_primary(1)
+
+    assert router.stats()["sticky_users"] == 2
+    assert router.is_sticky(1) and router.is_sticky(1000)
+    assert not router.is_sticky(2)
+
+
+def test_routing_session_sends_replica_reads_to_replica(monkeypatch):
+    """Тест: только запросы с replica=True уходят на реплику"""
+    from types import SimpleNamespace
+    from app.core import database
+
+    primary = SimpleNamespace(name="primary")
+    replica = SimpleNamespace(sync_engine=SimpleNamespace(name="replica"))
+    router = database.ReplicaRouter([replica], eject_seconds=60, sticky_seconds=60)
+    monkeypatch.setattr(database, "replica_router", router)
+    session = database.RoutingSession(bind=primary)
+
+    assert session.get_bind(**database.replica_bind()).name == "replica"
+    assert session.get_bind().name == "primary"
+
+    router.stick_to_primary(7)
+    assert session.get_bind(**database.replica_bind(7)).name == "primary"
+
+
+@pytest.mark.benchmark
+def test_hot_statement_overhead_benchmark():
+    """Тест: лямбда-запрос строится один раз и не меняет ключ кэша от вызова к вызову"""
+    from sqlalchemy import lambda_stmt, or_, select
+    from app.crud.cart import _CART_UPSERT
+    from app.models.user import User
+
+    def cached(login):
+        return lambda_stmt(lambda: select(User).filter(or_(User.email == login, User.phone == login)))
+
+    keys = {cached(f"user{i}@example.com")._generate_cache_key().key for i in range(5000)}
+    assert len(keys) == 1
+    # The upsert must have a cache key, otherwise it is recompiled on every call
+    assert _CART_UPSERT._generate_cache_key() is not None